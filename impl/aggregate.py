@@ -0,0 +1,306 @@
+"""
+Streaming aggregation of the bin-pack_*.csv experiment output, replacing the manual spreadsheet step.
+Rows are grouped by (Algorithm, Descending?, n, eps) and each group keeps one-pass statistics of the runtime and
+SOL/OPT: Welford's mean and variance, and a t-digest for quantiles. Both can be merged, and the state remembers how far
+into each file it has read, so re-running on files that are still being appended to only reads the new rows.
+"""
+import json
+import math
+import os
+
+# Quantiles written to the summary table
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+class RunningStats:
+    """
+    Welford's online mean and variance.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        # Sum of squared differences from the mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """
+        Combine with the stats of another set of values (Chan et al.'s parallel algorithm)
+        """
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def stdev(self):
+        """
+        Sample standard deviation, or 0 for fewer than 2 values
+        """
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2]
+
+
+class TDigest:
+    """
+    Merging t-digest for approximate quantiles in bounded memory. Values are buffered, then merged into centroids,
+    which are kept small near the tails (q near 0 or 1) and larger in the middle, so extreme quantiles stay accurate.
+    """
+
+    def __init__(self, compression=100, centroids=None):
+        self.compression = compression
+        # Sorted list of [mean, weight]
+        self.centroids = centroids or []
+        self.buffer = []
+
+    def add(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self.buffer.extend((mean, weight) for mean, weight in other.centroids)
+        self._compress()
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        points = [(mean, weight) for mean, weight in self.centroids]
+        for value in self.buffer:
+            if isinstance(value, tuple):
+                points.append(value)
+            else:
+                points.append((value, 1))
+        self.buffer = []
+        points.sort()
+
+        total = sum(weight for mean, weight in points)
+        centroids = []
+        seen = 0
+        current_mean, current_weight = points[0]
+        for mean, weight in points[1:]:
+            q = (seen + current_weight + weight / 2) / total
+            # A centroid may hold at most this much weight at quantile q
+            limit = 4 * total * q * (1 - q) / self.compression
+            if current_weight + weight <= max(1, limit):
+                current_mean += (mean - current_mean) * weight / (current_weight + weight)
+                current_weight += weight
+            else:
+                centroids.append([current_mean, current_weight])
+                seen += current_weight
+                current_mean, current_weight = mean, weight
+        centroids.append([current_mean, current_weight])
+        self.centroids = centroids
+
+    def quantile(self, q):
+        self._compress()
+        if not self.centroids:
+            return float('nan')
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        total = sum(weight for mean, weight in self.centroids)
+        target = q * total
+        # Interpolate between the centres of the centroids on either side of the target rank
+        seen = 0
+        previous_mean, previous_centre = self.centroids[0][0], self.centroids[0][1] / 2
+        if target <= previous_centre:
+            return previous_mean
+        for mean, weight in self.centroids:
+            centre = seen + weight / 2
+            if target <= centre:
+                if centre == previous_centre:
+                    return mean
+                return previous_mean + (mean - previous_mean) * (target - previous_centre) / (centre - previous_centre)
+            previous_mean, previous_centre = mean, centre
+            seen += weight
+        return self.centroids[-1][0]
+
+
+class GroupStats:
+    """
+    Statistics of the runtime and SOL/OPT of one (Algorithm, Descending?, n, eps) group
+    """
+
+    def __init__(self):
+        self.runtime = RunningStats()
+        self.ratio = RunningStats()
+        self.runtime_digest = TDigest()
+        self.ratio_digest = TDigest()
+
+    def add(self, runtime, ratio):
+        self.runtime.add(runtime)
+        self.ratio.add(ratio)
+        self.runtime_digest.add(runtime)
+        self.ratio_digest.add(ratio)
+
+    def merge(self, other):
+        self.runtime.merge(other.runtime)
+        self.ratio.merge(other.ratio)
+        self.runtime_digest.merge(other.runtime_digest)
+        self.ratio_digest.merge(other.ratio_digest)
+
+    def to_dict(self):
+        self.runtime_digest._compress()
+        self.ratio_digest._compress()
+        return {
+            'runtime': self.runtime.to_list(),
+            'ratio': self.ratio.to_list(),
+            'runtime_digest': self.runtime_digest.centroids,
+            'ratio_digest': self.ratio_digest.centroids,
+        }
+
+    @staticmethod
+    def from_dict(d):
+        stats = GroupStats()
+        stats.runtime = RunningStats(*d['runtime'])
+        stats.ratio = RunningStats(*d['ratio'])
+        stats.runtime_digest = TDigest(centroids=d['runtime_digest'])
+        stats.ratio_digest = TDigest(centroids=d['ratio_digest'])
+        return stats
+
+
+def parse_row(line):
+    """
+    :return: (algorithm, descending, n, runtime, ratio) for a result row written by pack_and_print, or None if the line
+             is a header, comment or a row from a different experiment. Rows with latencies get '+latency' added to the
+             algorithm, like local search's '+ls', since the sampling adds to their runtime.
+    """
+    fields = [field.strip() for field in line.split(',')]
+    # 7 fields, or 11 if pack_and_print recorded latencies
+    if len(fields) not in [7, 11] or fields[1] not in ['True', 'False']:
+        return None
+    algorithm = fields[0]
+    if len(fields) == 11:
+        algorithm += '+latency'
+    try:
+        return algorithm, fields[1] == 'True', int(fields[2]), float(fields[3]), float(fields[6])
+    except ValueError:
+        return None
+
+
+class Aggregator:
+    def __init__(self):
+        # (algorithm, descending, n, eps) -> GroupStats
+        self.groups = {}
+        # Path -> (bytes read so far, eps in effect at that point)
+        self.files = {}
+
+    def add(self, algorithm, descending, n, eps, runtime, ratio):
+        key = (algorithm, descending, n, eps)
+        if key not in self.groups:
+            self.groups[key] = GroupStats()
+        self.groups[key].add(runtime, ratio)
+
+    def read(self, path):
+        """
+        Read the rows of a results file that haven't been read yet.
+        :return: The number of rows added
+        """
+        path = os.path.abspath(path)
+        offset, eps = self.files.get(path, (0, None))
+        if os.path.getsize(path) < offset:
+            raise Exception('{} is smaller than when it was last read, it must have been replaced'.format(path))
+
+        added = 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    # A row that is still being written, read it next time
+                    break
+                offset += len(raw)
+                line = raw.decode().strip()
+                if line.startswith('Doing PTAS, eps='):
+                    eps = float(line[len('Doing PTAS, eps='):])
+                    continue
+
+                row = parse_row(line)
+                if row is None:
+                    continue
+                algorithm, descending, n, runtime, ratio = row
+                # eps only means something for the PTAS, including its +ls and +latency variants
+                is_ptas = algorithm.split('+')[0] == 'ptas_awfd'
+                self.add(algorithm, descending, n, eps if is_ptas else None, runtime, ratio)
+                added += 1
+
+        self.files[path] = (offset, eps)
+        return added
+
+    def merge(self, other):
+        for key, stats in other.groups.items():
+            if key in self.groups:
+                self.groups[key].merge(stats)
+            else:
+                self.groups[key] = stats
+        self.files.update(other.files)
+
+    def save(self, path):
+        state = {
+            'files': self.files,
+            'groups': [[list(key), stats.to_dict()] for key, stats in self.groups.items()],
+        }
+        with open(path, 'w') as f:
+            json.dump(state, f)
+
+    @staticmethod
+    def load(path):
+        aggregator = Aggregator()
+        with open(path) as f:
+            state = json.load(f)
+        aggregator.files = {path: tuple(value) for path, value in state['files'].items()}
+        for key, stats in state['groups']:
+            aggregator.groups[tuple(key)] = GroupStats.from_dict(stats)
+        return aggregator
+
+    def write_summary(self, path):
+        quantile_names = ['p{}'.format(str(q * 100).rstrip('0').rstrip('.')) for q in QUANTILES]
+        header = ['Algorithm', 'Descending?', 'n', 'eps', 'Count', 'Runtime mean (s)', 'Runtime stdev (s)'] + \
+                 ['Runtime {} (s)'.format(name) for name in quantile_names] + \
+                 ['SOL/OPT mean', 'SOL/OPT stdev'] + ['SOL/OPT {}'.format(name) for name in quantile_names]
+
+        def sort_key(key):
+            algorithm, descending, n, eps = key
+            return algorithm, descending, n, -1 if eps is None else eps
+
+        with open(path, 'w') as f:
+            f.write(', '.join(header) + '\n')
+            for key in sorted(self.groups, key=sort_key):
+                algorithm, descending, n, eps = key
+                stats = self.groups[key]
+                row = [algorithm, descending, n, '-' if eps is None else eps, stats.runtime.count,
+                       round(stats.runtime.mean, 6), round(stats.runtime.stdev(), 6)] + \
+                      [round(stats.runtime_digest.quantile(q), 6) for q in QUANTILES] + \
+                      [round(stats.ratio.mean, 6), round(stats.ratio.stdev(), 6)] + \
+                      [round(stats.ratio_digest.quantile(q), 6) for q in QUANTILES]
+                f.write(', '.join(str(value) for value in row) + '\n')
+
+
+def aggregate(paths, summary_path, state_path=None):
+    """
+    Add the new rows of the given results files to the saved state (if any), and write the summary table.
+    :return: The number of rows added
+    """
+    if state_path is not None and os.path.exists(state_path):
+        aggregator = Aggregator.load(state_path)
+    else:
+        aggregator = Aggregator()
+
+    added = sum(aggregator.read(path) for path in paths)
+    aggregator.write_summary(summary_path)
+    if state_path is not None:
+        aggregator.save(state_path)
+    return added
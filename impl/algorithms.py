@@ -0,0 +1,41 @@
+"""
+Registry of the packing algorithms by name. Modules are only imported when an algorithm from them is first asked for,
+so that eg. listing algorithms or packing with best_fit doesn't pay for importing NumPy.
+"""
+import importlib
+
+# Algorithm name -> (module, function). These all take a list of weights.
+ALGORITHMS = {
+    'next_fit': ('bin_pack', 'next_fit'),
+    'first_fit': ('bin_pack', 'first_fit'),
+    'worst_fit': ('bin_pack', 'worst_fit'),
+    'almost_worst_fit': ('bin_pack', 'almost_worst_fit'),
+    'best_fit': ('bin_pack', 'best_fit'),
+    'bucket_best_fit': ('bin_pack', 'bucket_best_fit'),
+    'k_bounded_first_fit': ('bin_pack', 'k_bounded_first_fit'),
+    'k_bounded_best_fit': ('bin_pack', 'k_bounded_best_fit'),
+    'k_bounded_worst_fit': ('bin_pack', 'k_bounded_worst_fit'),
+    'ptas_awfd': ('bin_pack', 'ptas_awfd'),
+    'constrained_first_fit': ('constrained_bin_pack', 'constrained_first_fit'),
+    'constrained_best_fit': ('constrained_bin_pack', 'constrained_best_fit'),
+}
+
+# These take an (n, d) array of demand vectors instead
+VECTOR_ALGORITHMS = {
+    'vector_first_fit': ('vector_bin_pack', 'vector_first_fit'),
+    'vector_best_fit': ('vector_bin_pack', 'vector_best_fit'),
+    'vector_worst_fit': ('vector_bin_pack', 'vector_worst_fit'),
+}
+
+
+def get_algorithm(name):
+    """
+    :return: The algorithm function with the given name, importing its module if needed
+    """
+    if name in ALGORITHMS:
+        module, function = ALGORITHMS[name]
+    elif name in VECTOR_ALGORITHMS:
+        module, function = VECTOR_ALGORITHMS[name]
+    else:
+        raise Exception('Unknown algorithm ' + str(name))
+    return getattr(importlib.import_module(module), function)
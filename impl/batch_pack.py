@@ -0,0 +1,134 @@
+from array import array
+
+from bin_pack import Bin
+from binary_tree import BinaryTree, NodeKey, NodePool
+
+
+class BatchPacker:
+    """
+    Packs many small instances in one call. pack_and_print has a lot of per-call overhead (printing, deepcopy, opening
+    the output file, building a new BinaryTree and Bins), which is larger than the packing itself for instances of a
+    few hundred items. Here bins are just loads in a list, and the list and tree are cleared and reused between
+    instances rather than reallocated.
+    """
+    ALGORITHMS = ['next_fit', 'first_fit', 'worst_fit', 'almost_worst_fit', 'best_fit']
+
+    def __init__(self):
+        # loads[b] is the weight packed into bin b of the current instance
+        self.loads = []
+        # The tree nodes' VALUES are the bin weight, NAMES are the bin index in loads[]. Its nodes come from a pool, so
+        # inserts and removes (and clearing it between instances) reuse them instead of allocating new ones.
+        self.bin_weights = BinaryTree(pool=NodePool())
+
+    def pack(self, weights, offsets, algorithm, decreasing):
+        """
+        :param weights: The item weights of every instance, concatenated. Each must be no larger than Bin.CAPACITY.
+        :param offsets: Instance i is weights[offsets[i]:offsets[i + 1]], so there is one more offset than instances.
+        :param algorithm: Name of the algorithm to run, one of ALGORITHMS
+        :param decreasing: Whether or not to pack the items of each instance by non-increasing weight
+        :return: (bin_counts, assignments) - bin_counts[i] is the number of bins instance i used, and assignments[j]
+                 is the index of the bin (within its instance) that weights[j] was packed into.
+        """
+        if algorithm not in self.ALGORITHMS:
+            raise Exception('Unknown algorithm ' + str(algorithm))
+        pack_instance = getattr(self, '_' + algorithm)
+
+        bin_counts = array('i', bytes(4 * (len(offsets) - 1)))
+        assignments = array('i', bytes(4 * len(weights)))
+        for instance in range(len(offsets) - 1):
+            start = offsets[instance]
+            end = offsets[instance + 1]
+            if decreasing:
+                order = sorted(range(start, end), key=weights.__getitem__, reverse=True)
+            else:
+                order = range(start, end)
+
+            self.loads.clear()
+            self.bin_weights.clear()
+            pack_instance(weights, order, assignments)
+            bin_counts[instance] = len(self.loads)
+
+        return bin_counts, assignments
+
+    def _next_fit(self, weights, order, assignments):
+        loads = self.loads
+        capacity = Bin.CAPACITY
+        current = -1
+        for index in order:
+            weight = weights[index]
+            if current < 0 or loads[current] + weight > capacity:
+                loads.append(0)
+                current += 1
+            loads[current] += weight
+            assignments[index] = current
+
+    def _first_fit(self, weights, order, assignments):
+        loads = self.loads
+        capacity = Bin.CAPACITY
+        for index in order:
+            weight = weights[index]
+            for b in range(len(loads)):
+                if loads[b] + weight <= capacity:
+                    break
+            else:
+                b = len(loads)
+                loads.append(0)
+            loads[b] += weight
+            assignments[index] = b
+
+    def _worst_fit(self, weights, order, assignments, almost=False):
+        loads = self.loads
+        bin_weights = self.bin_weights
+        capacity = Bin.CAPACITY
+        for index in order:
+            weight = weights[index]
+            node = None
+            if almost:
+                node = bin_weights.second_min()
+            if node is None:
+                node = bin_weights.min()
+
+            if node is not None and loads[node.key.name] + weight <= capacity:
+                b = node.key.name
+                bin_weights.remove(node.key)
+            else:
+                b = len(loads)
+                loads.append(0)
+            loads[b] += weight
+            bin_weights.insert(loads[b], b)
+            assignments[index] = b
+
+    def _almost_worst_fit(self, weights, order, assignments):
+        self._worst_fit(weights, order, assignments, True)
+
+    def _best_fit(self, weights, order, assignments):
+        loads = self.loads
+        bin_weights = self.bin_weights
+        capacity = Bin.CAPACITY
+        for index in order:
+            weight = weights[index]
+            node = bin_weights.find_largest_lessthan(capacity - weight)
+
+            if node is not None and loads[node.key.name] + weight <= capacity:
+                b = node.key.name
+                bin_weights.remove(NodeKey(loads[b], b))
+            else:
+                b = len(loads)
+                loads.append(0)
+            loads[b] += weight
+            bin_weights.insert(loads[b], b)
+            assignments[index] = b
+
+
+def pack_batch(instances, algorithm, decreasing):
+    """
+    Convenience wrapper for BatchPacker.pack which takes a list of instances (each a list of item weights) instead of
+    a flat list with offsets.
+    :return: Same as BatchPacker.pack
+    """
+    weights = array('d')
+    offsets = array('i', [0])
+    for items in instances:
+        weights.extend(items)
+        offsets.append(len(weights))
+    return BatchPacker().pack(weights, offsets, algorithm, decreasing)
@@ -1,8 +1,10 @@
+import gc
 import math
-from timeit import default_timer as timer
+from time import perf_counter_ns
 from copy import deepcopy
 
-from binary_tree import BinaryTree
+from binary_tree import BinaryTree, NodeKey, NodePool
+from residual_buckets import ResidualBuckets
 
 class Bin:
     CAPACITY = 1
@@ -38,6 +40,18 @@ class Bin:
         self.items.append((item_name, item_weight))
         return True
 
+    def remove_item(self, item):
+        """
+        Remove the given item from this bin.
+        :param item: A (name, weight) tuple, as stored in self.items
+        """
+        self.items.remove(item)
+        if self.items:
+            self.weight -= item[1]
+        else:
+            # Don't let floating point error leave a little weight in an empty bin
+            self.weight = 0
+
     def __str__(self):
         result = 'Bin {}: '.format(self.name)
         total_w = 0
@@ -49,7 +63,43 @@ class Bin:
         return result
 
 
-def next_fit(items, decreasing):
+class BinPool:
+    """
+    Free-lists of Bins and tree Nodes, so that running the algorithms over and over (eg. in test_all) reuses them
+    instead of allocating hundreds of thousands of objects per run and leaving them to the GC.
+    Pass one to an algorithm with pool=, and release() the bins once you are done with them.
+    """
+    def __init__(self):
+        self.free_bins = []
+        self.nodes = NodePool()
+
+    def new_bin(self, name):
+        if not self.free_bins:
+            return Bin(name)
+
+        b = self.free_bins.pop()
+        b.items.clear()
+        b.weight = 0
+        b.name = name
+        return b
+
+    def release(self, bins):
+        self.free_bins.extend(bins)
+
+
+def _new_bin(name, pool):
+    if pool is None:
+        return Bin(name)
+    return pool.new_bin(name)
+
+
+def _new_tree(pool):
+    if pool is None:
+        return BinaryTree()
+    return BinaryTree(pool=pool.nodes)
+
+
+def next_fit(items, decreasing, pool=None, sampler=None):
     """
     Runtime: O(n)
     :param items: List of integer item weights, each less than Bin.CAPACITY
@@ -63,20 +113,26 @@ def next_fit(items, decreasing):
 
     bins = []
     bin_index = 0
-    b = Bin(bin_index)
+    b = _new_bin(bin_index, pool)
     bin_index += 1
     bins.append(b)
+    countdown = 0 if sampler is None else 1
     for item, weight in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
         if not b.try_add_item(item, weight):
-            b = Bin(bin_index)
+            b = _new_bin(bin_index, pool)
             bin_index += 1
             if not b.try_add_item(item, weight):
                 raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
             bins.append(b)
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
 
     return bins
 
-def first_fit(items, decreasing, existing_bins=None):
+def first_fit(items, decreasing, existing_bins=None, pool=None, sampler=None):
     """
     Runtime: O(n**2)
     :param items: List of integer item weights, each less than Bin.CAPACITY
@@ -93,27 +149,32 @@ def first_fit(items, decreasing, existing_bins=None):
         bins = existing_bins
 
     bin_index = 0
+    countdown = 0 if sampler is None else 1
     for index, item in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
         packed = False
         for b in bins:
             if b.try_add_item(index, item):
                 packed = True
                 break
         if not packed:
-            b = Bin(bin_index)
+            b = _new_bin(bin_index, pool)
             bin_index += 1
             if not b.try_add_item(index, item):
                 print('Error! Could not add item into empty bin. Is the item larger than the bin?')
             bins.append(b)
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
     return bins
 
 
-def set_epsilon(eps):
-    global epsilon
-    epsilon = eps
+# Default epsilon for ptas_awfd
+DEFAULT_EPSILON = 0.1
 
 
-def ptas_awfd(items, descending):     # Descending is ignored, but we accept it because pack_and_print will pass it
+def ptas_awfd(items, descending, pool=None, sampler=None, epsilon=DEFAULT_EPSILON):     # Descending is ignored, but we accept it because pack_and_print will pass it
     print('Running ' + ptas_awfd.__name__ + ' with epsilon={}'.format(epsilon))
 
     small_items = []
@@ -124,17 +185,17 @@ def ptas_awfd(items, descending):     # Descending is ignored, but we accept it
         else:
             small_items.append(item)
 
-    large_packed = almost_worst_fit(large_items, True)
-    return almost_worst_fit(small_items, True, large_packed)
+    large_packed = almost_worst_fit(large_items, True, pool=pool, sampler=sampler)
+    return almost_worst_fit(small_items, True, large_packed, pool, sampler)
 
 
-def worst_fit(items, decreasing, existing_bins=None):
-    return _worst_fit(items, decreasing, False, existing_bins)
+def worst_fit(items, decreasing, existing_bins=None, pool=None, sampler=None):
+    return _worst_fit(items, decreasing, False, existing_bins, pool, sampler)
 
-def almost_worst_fit(items, decreasing, existing_bins=None):
-    return _worst_fit(items, decreasing, True, existing_bins)
+def almost_worst_fit(items, decreasing, existing_bins=None, pool=None, sampler=None):
+    return _worst_fit(items, decreasing, True, existing_bins, pool, sampler)
 
-def _worst_fit(items, decreasing, almost, existing_bins=None):
+def _worst_fit(items, decreasing, almost, existing_bins=None, pool=None, sampler=None):
     """
     Runtime: O(n*logn)
     :param almost: True to run AlmostWorstFit, False to run WorstFit
@@ -152,10 +213,14 @@ def _worst_fit(items, decreasing, almost, existing_bins=None):
         bins = []
     # The tree nodes' VALUES are the bin weight (this is what it is sorted by)
     # Each node's NAME is the bin index (in bins[]) that has that weight
-    bin_weights = BinaryTree()
+    bin_weights = _new_tree(pool)
 
     bin_counter = 0
+    countdown = 0 if sampler is None else 1
     for item, weight in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
         packed = False
 
         light_bin_node = None
@@ -170,7 +235,7 @@ def _worst_fit(items, decreasing, almost, existing_bins=None):
             packed = lightest_bin.try_add_item(item, weight)
 
         if not packed:
-            b = Bin(bin_counter)
+            b = _new_bin(bin_counter, pool)
             bin_counter += 1
             if not b.try_add_item(item, weight):
                 raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
@@ -181,16 +246,22 @@ def _worst_fit(items, decreasing, almost, existing_bins=None):
             # index in the list of bins.
             bin_weights.remove(light_bin_node.key)
             bin_weights.insert(lightest_bin.weight, lightest_bin.name)
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
 
+    # Give the tree's nodes back to the pool, if there is one
+    bin_weights.clear()
     return bins
 
 
-def best_fit(items, decreasing, existing_bins=None):
+def best_fit(items, decreasing, existing_bins=None, pool=None, sampler=None):
     """
     Runtime: O(nlogn)
     :param items: List of integer item weights, each less than Bin.CAPACITY
     :param decreasing: Whether or not to sort the items by non-increasing weights before packing
     :param existing_bins: The algorithm can run on an already-packed set of bins, for supporting the PTAS.
+    :param pool: Optional BinPool to take Bins and tree nodes from.
+    :param sampler: Optional latency.LatencySampler to record per-item placement latency into.
     :return: A list of 'bins', each a list of items contained in that bin.
     """
 
@@ -206,15 +277,19 @@ def best_fit(items, decreasing, existing_bins=None):
     bin_counter = 0
     # The tree nodes' VALUES are the bin weight (this is what it is sorted by)
     # Each node's NAME is the bin index (in bins[]) that has that weight
-    bin_weights = BinaryTree()
+    bin_weights = _new_tree(pool)
 
+    countdown = 0 if sampler is None else 1
     for item, weight in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
         # The current weight of an optimal bin (ie, if this item is weight 6, we want a bin with weight 4)
         optimal_weight = Bin.CAPACITY - weight
         best_bin_node = bin_weights.find_largest_lessthan(optimal_weight)
 
         if not best_bin_node:
-            new_bin = Bin(bin_counter)
+            new_bin = _new_bin(bin_counter, pool)
             bin_counter += 1
 
             if not new_bin.try_add_item(item, weight):
@@ -230,11 +305,169 @@ def best_fit(items, decreasing, existing_bins=None):
                 bin_weights.insert(best_bin.weight, best_bin.name)
                 #print('Update: name {}, weight {}, to name {}, weight {}'
                 #      .format(best_bin_node.key.name, best_bin_node.key.value, best_bin.name, best_bin.weight))
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
+
+    bin_weights.clear()
+    return bins
+
+
+def bucket_best_fit(items, decreasing, existing_bins=None, pool=None, sampler=None, buckets=64):
+    """
+    Approximate Best Fit, using ResidualBuckets instead of a tree to find the bin for each item.
+    Runtime: O(nlogn), but only over the bins in one bucket at a time
+    :param buckets: Number of residual capacity buckets. More buckets are closer to exact best_fit.
+    Other parameters are the same as best_fit.
+    """
+    if decreasing:
+        items.sort(reverse=True)
+
+    if existing_bins:
+        bins = existing_bins
+    else:
+        bins = []
+
+    bin_counter = 0
+    # Each bucket entry's NAME is the bin index (in bins[])
+    residuals = ResidualBuckets(buckets, Bin.CAPACITY)
+
+    countdown = 0 if sampler is None else 1
+    for item, weight in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
+
+        found = residuals.pop_fit(weight)
+        b = None
+        if found is not None:
+            b = bins[found[1]]
+            if not b.try_add_item(item, weight):
+                # Rounding error in the residual - put the bin back and use a new one
+                residuals.add(found[0], found[1])
+                b = None
+
+        if b is None:
+            b = _new_bin(bin_counter, pool)
+            bin_counter += 1
+            if not b.try_add_item(item, weight):
+                raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
+            bins.append(b)
+        residuals.add(Bin.CAPACITY - b.weight, b.name)
+
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
 
     return bins
 
 
-def pack_and_print(items, algorithm, outfile, descending):
+# Default number of open bins for the k_bounded algorithms
+DEFAULT_OPEN_BINS = 8
+
+
+def k_bounded_first_fit(items, decreasing, existing_bins=None, pool=None, sampler=None, k=DEFAULT_OPEN_BINS,
+                        close_policy='oldest'):
+    return _k_bounded_fit(items, decreasing, 'first', existing_bins, pool, sampler, k, close_policy)
+
+def k_bounded_best_fit(items, decreasing, existing_bins=None, pool=None, sampler=None, k=DEFAULT_OPEN_BINS,
+                       close_policy='oldest'):
+    return _k_bounded_fit(items, decreasing, 'best', existing_bins, pool, sampler, k, close_policy)
+
+def k_bounded_worst_fit(items, decreasing, existing_bins=None, pool=None, sampler=None, k=DEFAULT_OPEN_BINS,
+                        close_policy='oldest'):
+    return _k_bounded_fit(items, decreasing, 'worst', existing_bins, pool, sampler, k, close_policy)
+
+def _k_bounded_fit(items, decreasing, fit, existing_bins, pool, sampler, k, close_policy):
+    """
+    Bounded-space First/Best/Worst Fit, which keep at most k bins open. Once an item fits none of them, one open bin is
+    closed and a new one is opened. Closed bins are never packed into again, and are removed from the tree, so the
+    tree never has more than k nodes and the per-item cost doesn't grow with n.
+    Runtime: O(n*logk)
+    :param fit: 'first', 'best' or 'worst'
+    :param k: The maximum number of open bins
+    :param close_policy: 'oldest' closes the bin that was opened first, 'fullest' closes the heaviest bin
+    Other parameters are the same as best_fit.
+    """
+    if k < 1:
+        raise Exception('Must keep at least 1 bin open, not ' + str(k))
+    if fit not in ['first', 'best', 'worst']:
+        raise Exception('Unknown fit ' + str(fit))
+    if close_policy not in ['oldest', 'fullest']:
+        raise Exception('Unknown close policy ' + str(close_policy))
+
+    if decreasing:
+        items.sort(reverse=True)
+
+    if existing_bins:
+        bins = existing_bins
+    else:
+        bins = []
+
+    bin_counter = 0
+    # The open bins in the order they were opened
+    open_bins = []
+    # The tree nodes' VALUES are the weight of an open bin, NAMES are the bin index (in bins[])
+    bin_weights = _new_tree(pool)
+
+    countdown = 0 if sampler is None else 1
+    for item, weight in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
+
+        target = None
+        if fit == 'first':
+            for b in open_bins:
+                if b.has_room(weight):
+                    target = b
+                    break
+        else:
+            if fit == 'best':
+                node = bin_weights.find_largest_lessthan(Bin.CAPACITY - weight)
+            else:
+                node = bin_weights.min()
+            if node is not None and bins[node.key.name].has_room(weight):
+                target = bins[node.key.name]
+
+        if target is None:
+            if len(open_bins) == k:
+                if close_policy == 'oldest':
+                    closing = open_bins[0]
+                else:
+                    closing = bins[bin_weights.max().key.name]
+                open_bins.remove(closing)
+                bin_weights.remove(NodeKey(closing.weight, closing.name))
+
+            target = _new_bin(bin_counter, pool)
+            bin_counter += 1
+            bins.append(target)
+            open_bins.append(target)
+        else:
+            bin_weights.remove(NodeKey(target.weight, target.name))
+
+        if not target.try_add_item(item, weight):
+            raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
+        bin_weights.insert(target.weight, target.name)
+
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
+
+    bin_weights.clear()
+    return bins
+
+
+def pack_and_print(items, algorithm, outfile, descending, improve_budget=None, pool=None, disable_gc=False,
+                   latency_every=None, params=None):
+    """
+    :param improve_budget: If not None, run the local_search improvement stage on the algorithm's bins for up to this
+                           many seconds. The row is then written as '<algorithm>+ls' with the combined runtime.
+    :param pool: Optional BinPool for the algorithm to take its Bins and tree nodes from. They are released back into
+                 it once the results are written.
+    :param disable_gc: Disable the garbage collector while the algorithm runs, and restore it afterwards.
+    :param latency_every: If not None, record the placement latency of every latency_every'th item, and add its
+                          p50, p99, p999 and max in ns to the row after SOL/OPT.
+    :param params: Optional dict of extra keyword arguments for the algorithm, eg. {'epsilon': 0.05} for ptas_awfd
+    :return: The elapsed time in seconds
+    """
     # print(items)
     tw = sum(item for item in items)
     opt = math.ceil(tw / Bin.CAPACITY)
@@ -246,19 +479,59 @@ def pack_and_print(items, algorithm, outfile, descending):
     # Copy items so that the algorithm's changes to the list don't persist
     items_copy = deepcopy(items)
 
-    t = timer()
-    bins = algorithm(items_copy, descending)
-    elapsed = round(timer() - t, 6)
+    gc_was_enabled = gc.isenabled()
+    if disable_gc:
+        gc.disable()
+    kwargs = {}
+    if params is not None:
+        kwargs.update(params)
+    if pool is not None:
+        kwargs['pool'] = pool
+    sampler = None
+    if latency_every is not None:
+        from latency import LatencySampler
+        sampler = LatencySampler(latency_every)
+        kwargs['sampler'] = sampler
+
+    try:
+        t = perf_counter_ns()
+        bins = algorithm(items_copy, descending, **kwargs)
+        elapsed = round((perf_counter_ns() - t) / 1e9, 6)
+    finally:
+        if disable_gc and gc_was_enabled:
+            gc.enable()
 
     print('Took ' + str(elapsed) + "s")
+
+    # improve() only returns the bins it didn't empty, but they all go back to the pool
+    packed = bins
+    if improve_budget is not None:
+        from local_search import improve
+        before = len(bins)
+        bins, saved, improve_elapsed = improve(bins, improve_budget)
+        print('Local search saved {} of {} bins in {}s ({} bins/s)'
+              .format(saved, before, round(improve_elapsed, 6), round(saved / improve_elapsed, 6)))
+        name += '+ls'
+        elapsed = round(elapsed + improve_elapsed, 6)
+
     sol = len(bins)
     print('Used {} bins compared to a best-case optimal of {}'.format(sol, opt))
     ratio = round(sol / opt, 6)
     print('{} approx ratio for this instance is {}'.format(name, ratio))
 
+    row = "{}, {}, {}, {}, {}, {}, {}".format(name, descending, len(items), elapsed, sol, opt, ratio)
+    if sampler is not None:
+        p50, p99, p999, max_latency = sampler.histogram.summary()
+        print('Placement latency over {} sampled items: p50 {}ns, p99 {}ns, p999 {}ns, max {}ns'
+              .format(sampler.histogram.total, p50, p99, p999, max_latency))
+        row += ", {}, {}, {}, {}".format(p50, p99, p999, max_latency)
+
     with open(outfile, 'a') as f:
-        f.write("{}, {}, {}, {}, {}, {}, {}\n"
-                .format(name, descending, len(items), elapsed, sol, opt, ratio))
+        f.write(row + "\n")
+
+    if pool is not None:
+        pool.release(packed)
+    return elapsed
 """
     for index, b in enumerate(bins):
         print(b)
@@ -1,8 +1,22 @@
+"""
+Command line entry point for running the algorithms and experiments. Run from this directory with eg.
+    python -m bin_pack_main pack --algorithm best_fit --random 1000 --descending
+    python -m bin_pack_main sweep
+    python -m bin_pack_main benchmark latency --input-size 10000
+    python -m bin_pack_main generate 1000 --output items.txt
+    python -m bin_pack_main aggregate bin-pack_*.csv --state summary.json --summary summary.csv
+Importing this module has no side effects.
+"""
 import math
+import os
+import sys
 
-from bin_pack import pack_print_all, pack_and_print, first_fit, set_epsilon, ptas_awfd, almost_worst_fit
+from bin_pack import pack_print_all, pack_and_print, first_fit, ptas_awfd, almost_worst_fit, next_fit, \
+    worst_fit, best_fit, bucket_best_fit, k_bounded_first_fit, k_bounded_best_fit, k_bounded_worst_fit, Bin, \
+    BinPool, DEFAULT_EPSILON
 import random
 import time
+from timeit import default_timer as timer
 
 
 def random_int_list(min, max, length):
@@ -25,6 +39,11 @@ def random_list(length):
     return result
 
 
+def random_vector_list(length, dimensions):
+    # Each row is one item's demand in every dimension, eg. (CPU, memory)
+    return [random_list(dimensions) for x in range(0, length)]
+
+
 def test_all(input_size, outfile):
     for i in range(128):
         pack_print_all(random_list(input_size), outfile)
@@ -34,12 +53,10 @@ def test_ptas(input_size, outfile):
     epses = [0.5, 0.25, 0.1, 0.05, 0.01, 0.001]
 
     for eps in epses:
-        set_epsilon(eps)
-
         with open(outfile, 'a') as f:
             f.write('Doing PTAS, eps={}\n'.format(eps))
         for i in range(64):
-            pack_and_print(random_list(input_size), ptas_awfd, outfile, True)
+            pack_and_print(random_list(input_size), ptas_awfd, outfile, True, params={'epsilon': eps})
 
 
 def worst_case_nf(input_size, outfile):
@@ -65,18 +82,466 @@ def worst_case_ff(input_size, outfile):
     pack_and_print(bad_input_ff, first_fit, outfile, True)
 
 
+def test_local_search(input_size, outfile, time_budget=1.0):
+    algorithms = [next_fit, worst_fit, almost_worst_fit, best_fit]
+    for i in range(16):
+        items = random_list(input_size)
+        for algorithm in algorithms:
+            pack_and_print(items, algorithm, outfile, True)
+            pack_and_print(items, algorithm, outfile, True, time_budget)
+
+
+def test_timing_stability(input_size, outfile, algorithm=best_fit, trials=128):
+    """
+    Compare the variance of the runtime across trials with and without pooling and the GC disabled. Each trial runs
+    every mode on the same instance, so drift in the machine's speed affects all modes alike.
+    With best_fit at n=2000, pooling mostly helps the tail: the max runtime drops by about a third, the stdev by about
+    15%, and the mean by about 5%. Disabling the GC on top of pooling makes little further difference.
+    """
+    import statistics
+
+    pool = BinPool()
+    modes = [
+        ('default', {}),
+        ('pooled', {'pool': pool}),
+        ('pooled, gc disabled', {'pool': pool, 'disable_gc': True}),
+    ]
+    times = {mode: [] for mode, kwargs in modes}
+    for i in range(trials):
+        items = random_list(input_size)
+        for mode, kwargs in modes:
+            times[mode].append(pack_and_print(items, algorithm, outfile, True, **kwargs))
+
+    for mode, kwargs in modes:
+        mean = statistics.mean(times[mode])
+        stdev = statistics.stdev(times[mode])
+        line = 'Timing for {} ({}): mean {}s, stdev {}s, cv {}, max {}s'.format(
+            algorithm.__name__, mode, round(mean, 6), round(stdev, 6), round(stdev / mean, 6), max(times[mode]))
+        print(line)
+        with open(outfile, 'a') as f:
+            f.write(line + '\n')
+
+
+def test_latency(input_size, outfile, sample_every=16):
+    with open(outfile, 'a') as f:
+        f.write('Algorithm, Descending?, n, Runtime (s), SOL, OPT, SOL/OPT, p50 (ns), p99 (ns), p999 (ns), Max (ns)\n')
+
+    algorithms = [next_fit, worst_fit, almost_worst_fit, best_fit]
+    for i in range(16):
+        items = random_list(input_size)
+        for algorithm in algorithms:
+            pack_and_print(items, algorithm, outfile, True, latency_every=sample_every)
+
+
+def random_trace(length, live_items):
+    """
+    Random arrival/departure trace for dynamic_bin_pack.replay. Items arrive until there are about live_items of them,
+    after which arrivals and departures (of a random live item) are equally likely.
+    """
+    trace = []
+    live = []
+    arrivals = 0
+    for x in range(length):
+        if not live or (len(live) < live_items and random.random() < 0.9) or random.random() < 0.5:
+            trace.append((True, random_list(1)[0]))
+            live.append(arrivals)
+            arrivals += 1
+        else:
+            index = random.randrange(len(live))
+            live[index], live[-1] = live[-1], live[index]
+            trace.append((False, live.pop()))
+    return trace
+
+
+def test_dynamic(trace_length, outfile, live_items=10000, thresholds=(None, 0.2, 0.1, 0.05)):
+    from dynamic_bin_pack import DynamicPacker, replay
+
+    trace = random_trace(trace_length, live_items)
+    with open(outfile, 'a') as f:
+        f.write('Dynamic, Threshold, Events, Runtime (s), Events/s, Final bins, Final LB, Mean bins/LB, '
+                'Compactions, Moved items\n')
+
+    for threshold in thresholds:
+        # A threshold of None means never compact
+        packer = DynamicPacker(2 if threshold is None else threshold)
+        elapsed, samples = replay(trace, packer)
+        ratios = [bins / lb for index, bins, lb in samples if lb > 0]
+        row = 'dynamic_best_fit, {}, {}, {}, {}, {}, {}, {}, {}, {}'.format(
+            threshold, len(trace), round(elapsed, 6), round(len(trace) / elapsed), len(packer), packer.lower_bound(),
+            round(sum(ratios) / len(ratios), 6), packer.compactions, packer.moved_items)
+        print(row)
+        with open(outfile, 'a') as f:
+            f.write(row + '\n')
+            for index, bins, lb in samples:
+                f.write('{}, {}, {}\n'.format(index, bins, lb))
+
+
+def test_sharded(input_size, outfile, algorithm=best_fit, descending=True, shard_counts=(2, 4, 8)):
+    from sharded_pack import sharded
+
+    for i in range(8):
+        items = random_list(input_size)
+        single = pack_and_print(items, algorithm, outfile, descending)
+        for shards in shard_counts:
+            elapsed = pack_and_print(items, sharded(algorithm, shards), outfile, descending)
+            line = 'Speedup with {} shards: {}'.format(shards, round(single / elapsed, 6))
+            print(line)
+            with open(outfile, 'a') as f:
+                f.write(line + '\n')
+
+
+def test_bucket_best_fit(input_size, outfile, descending=True, bucket_counts=(16, 64, 256, 1024, 4096)):
+    with open(outfile, 'a') as f:
+        f.write('Algorithm, Descending?, n, K, Runtime (s), Items/s, SOL, best_fit SOL, Difference\n')
+
+    for i in range(16):
+        items = random_list(input_size)
+        t = timer()
+        exact = len(best_fit(list(items), descending))
+        elapsed = timer() - t
+        rows = ['best_fit, {}, {}, -, {}, {}, {}, {}, 0'.format(
+            descending, input_size, round(elapsed, 6), round(input_size / elapsed), exact, exact)]
+
+        for buckets in bucket_counts:
+            t = timer()
+            sol = len(bucket_best_fit(list(items), descending, buckets=buckets))
+            elapsed = timer() - t
+            rows.append('bucket_best_fit, {}, {}, {}, {}, {}, {}, {}, {}'.format(
+                descending, input_size, buckets, round(elapsed, 6), round(input_size / elapsed), sol, exact,
+                sol - exact))
+
+        with open(outfile, 'a') as f:
+            for row in rows:
+                print(row)
+                f.write(row + '\n')
+
+
+def test_k_bounded(input_size, outfile, sample_every=16):
+    """
+    The per-item latency of the k_bounded algorithms should stay the same as n grows up to input_size, unlike
+    best_fit's.
+    """
+    algorithms = [k_bounded_first_fit, k_bounded_best_fit, k_bounded_worst_fit, best_fit]
+    for divisor in [1000, 100, 10, 1]:
+        items = random_list(max(1, input_size // divisor))
+        for algorithm in algorithms:
+            pack_and_print(items, algorithm, outfile, False, latency_every=sample_every)
+
+
+def test_incremental(input_size, outfile, deltas=(0.001, 0.01, 0.1)):
+    """
+    Compare repairing a Best Fit Decreasing packing after a delta (the same number of items removed and added) against
+    packing the new instance from scratch.
+    """
+    from incremental import IncrementalPacker
+
+    # Regression check: removing an item can round a bin's weight down to just under half, so that it and another bin
+    # of exactly half both look mergeable though their items don't fit in one bin. They must be left alone.
+    target = Bin(0)
+    target.try_add_item(0, 0.5)
+    source = Bin(1)
+    for name, weight in enumerate([0.16995310865732713, 0.10623463268498165, 0.1731879190807572,
+                                   0.05062433957693405, 0.19818189984411588], 1):
+        source.try_add_item(name, weight)
+    source.remove_item((5, 0.19818189984411588))
+    packer = IncrementalPacker([target, source])
+    if len(packer) != 2 or packer.apply(removed=[0]) != [] or len(packer) != 1:
+        raise Exception('Error! Bins that only look mergeable after rounding were not left alone')
+
+    with open(outfile, 'a') as f:
+        f.write('Delta, n, Incremental (s), Fresh (s), Speedup, Incremental SOL, Fresh SOL, Incremental/Fresh\n')
+
+    for i in range(8):
+        items = random_list(input_size)
+        packer = IncrementalPacker(best_fit(items, True))
+        live = {name: weight for b in packer.to_bins() for name, weight in b.items}
+
+        for delta in deltas:
+            count = max(1, int(input_size * delta))
+            removed = random.sample(sorted(live), count)
+            added = random_list(count)
+
+            t = timer()
+            names = packer.apply(added, removed)
+            incremental_elapsed = timer() - t
+
+            for name in removed:
+                del live[name]
+            live.update(zip(names, added))
+
+            t = timer()
+            fresh = len(best_fit(list(live.values()), True))
+            fresh_elapsed = timer() - t
+
+            row = '{}, {}, {}, {}, {}, {}, {}, {}'.format(
+                delta, input_size, round(incremental_elapsed, 6), round(fresh_elapsed, 6),
+                round(fresh_elapsed / incremental_elapsed, 2), len(packer), fresh, round(len(packer) / fresh, 6))
+            print(row)
+            with open(outfile, 'a') as f:
+                f.write(row + '\n')
+
+
+def test_constrained(input_size, outfile, max_items=(None, 2, 4), conflict_degrees=(0, 1, 8)):
+    """
+    Throughput and bins used by the constrained algorithms, with random conflict pairs averaging the given number per
+    item, against unconstrained best_fit. LB is the larger of the total weight and n / max_items.
+    """
+    from constrained_bin_pack import constrained_first_fit, constrained_best_fit
+
+    with open(outfile, 'a') as f:
+        f.write('Algorithm, Descending?, n, max_items, Conflicts per item, Runtime (s), Items/s, SOL, LB\n')
+
+    for i in range(8):
+        items = random_list(input_size)
+        lower_bound = math.ceil(sum(items))
+        t = timer()
+        sol = len(best_fit(list(items), True))
+        elapsed = timer() - t
+        rows = ['best_fit, True, {}, -, 0, {}, {}, {}, {}'.format(
+            input_size, round(elapsed, 6), round(input_size / elapsed), sol, lower_bound)]
+
+        for limit in max_items:
+            for degree in conflict_degrees:
+                conflicts = []
+                while len(conflicts) < input_size * degree // 2:
+                    a, b = random.randrange(input_size), random.randrange(input_size)
+                    if a != b:
+                        conflicts.append((a, b))
+                bound = lower_bound if limit is None else max(lower_bound, math.ceil(input_size / limit))
+
+                for algorithm in [constrained_first_fit, constrained_best_fit]:
+                    t = timer()
+                    sol = len(algorithm(list(items), True, max_items=limit, conflicts=conflicts))
+                    elapsed = timer() - t
+                    rows.append('{}, True, {}, {}, {}, {}, {}, {}, {}'.format(
+                        algorithm.__name__, input_size, '-' if limit is None else limit, degree, round(elapsed, 6),
+                        round(input_size / elapsed), sol, bound))
+
+        with open(outfile, 'a') as f:
+            for row in rows:
+                print(row)
+                f.write(row + '\n')
+
+
+def shuffled(items):
+    random.shuffle(items)
+    return items
+
+
+# Weight distributions to train the selector on, name -> function of the number of items. These include the worst cases
+# above, shuffled, since they are where the algorithms differ most.
+DISTRIBUTIONS = {
+    'uniform': random_list,
+    'small': lambda length: [random.uniform(0.001, 0.25) for x in range(length)],
+    'large': lambda length: [random.uniform(0.25, 1) for x in range(length)],
+    'thirds': lambda length: [random.uniform(0.25, 0.5) for x in range(length)],
+    'bimodal': lambda length: [random.choice([random.uniform(0.5, 0.7), random.uniform(0.1, 0.3)])
+                               for x in range(length)],
+    'worst_case_nf': lambda length: shuffled([1 / 2, 1 / (2 * length)] * int(math.ceil(length / 2))),
+    'worst_case_ff': lambda length: shuffled([1 / 7 + 0.001, 1 / 3 + 0.001, 1 / 2 + 0.001] *
+                                             int(math.ceil(length / 3))),
+}
+
+
+def train_selector(input_size, outfile, trials=4):
+    """
+    Write selector training rows for instances of every distribution in DISTRIBUTIONS, with input_size/4, input_size/2
+    and input_size items. pack --algorithm auto --calibration <outfile> then uses them.
+    """
+    from selector import TRAINING_HEADER, training_rows
+
+    with open(outfile, 'a') as f:
+        f.write(TRAINING_HEADER)
+    for name, distribution in DISTRIBUTIONS.items():
+        for size in [max(1, input_size // 4), max(1, input_size // 2), input_size]:
+            for i in range(trials):
+                rows = training_rows(distribution(size))
+                print('Trained on {} instance with {} items'.format(name, size))
+                with open(outfile, 'a') as f:
+                    f.writelines(rows)
+
+
+def test_vector(input_size, outfile, dimensions=2):
+    from vector_bin_pack import pack_print_all_vector
+
+    with open(outfile, 'a') as f:
+        f.write('Doing vector packing, d={}\n'.format(dimensions))
+    for i in range(16):
+        pack_print_all_vector(random_vector_list(input_size, dimensions), outfile)
+
+
 INPUT_SIZE = 100000
-OUTFILE = 'bin-pack_' + time.strftime("%m-%d_%H-%M-%S", time.gmtime()) + ".csv"
-with open(OUTFILE, 'a') as F:
-    F.write('Algorithm, Descending?, n, Runtime (s), SOL, OPT, SOL/OPT\n')
+HEADER = 'Algorithm, Descending?, n, Runtime (s), SOL, OPT, SOL/OPT\n'
+
+# Benchmark name -> (function taking (input_size, outfile), note on input size)
+BENCHMARKS = {
+    'worst_case_nf': (worst_case_nf, 'Includes first_fit, which is slow, so use a smaller input size'),
+    'worst_case_ff': (worst_case_ff, 'Includes first_fit, which is slow, so use a smaller input size'),
+    'local_search': (test_local_search, ''),
+    'timing_stability': (test_timing_stability, ''),
+    'latency': (test_latency, ''),
+    'dynamic': (test_dynamic, 'The input size is the trace length'),
+    'sharded': (test_sharded, ''),
+    'bucket_best_fit': (test_bucket_best_fit, ''),
+    'k_bounded': (test_k_bounded, 'Runs input sizes from input_size/1000 up to input_size'),
+    'incremental': (test_incremental, ''),
+    'constrained': (test_constrained, ''),
+    'selector': (train_selector, 'Includes first_fit, which is slow, so use a smaller input size, eg. 2000'),
+    'vector': (test_vector, 'Vector packing keeps every bin open, so use a smaller input size'),
+}
+
+
+def default_outfile():
+    return 'bin-pack_' + time.strftime("%m-%d_%H-%M-%S", time.gmtime()) + ".csv"
+
+
+def start_outfile(outfile):
+    """
+    Write the CSV header, unless the file already has contents.
+    """
+    if not os.path.exists(outfile) or os.path.getsize(outfile) == 0:
+        with open(outfile, 'a') as f:
+            f.write(HEADER)
+
+
+def read_items(path):
+    """
+    Read item weights, one per line, from the given file or '-' for stdin.
+    """
+    if path == '-':
+        lines = sys.stdin.read().split()
+    else:
+        with open(path) as f:
+            lines = f.read().split()
+    return [float(line) for line in lines]
+
+
+def pack_command(args):
+    from algorithms import get_algorithm
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.input is not None:
+        items = read_items(args.input)
+    else:
+        items = random_list(args.random)
+
+    algorithm = args.algorithm
+    descending = args.descending
+    if algorithm == 'auto':
+        from selector import Selector
+
+        if not args.calibration:
+            raise Exception('--algorithm auto needs --calibration training files from the selector benchmark')
+        algorithm, descending, gap = Selector.calibrate(args.calibration).select(items, args.max_gap)
+        print('Selected {}, descending={}, predicted gap to lower bound {}'.format(algorithm, descending, round(gap, 6)))
+
+    # Checked against the algorithm actually run, since auto never picks ptas_awfd or a constrained_ algorithm
+    params = {}
+    if args.epsilon is not None:
+        if algorithm != 'ptas_awfd':
+            raise Exception('--epsilon needs --algorithm ptas_awfd, got ' + algorithm)
+        params['epsilon'] = args.epsilon
+    if args.max_items is not None:
+        if not algorithm.startswith('constrained_'):
+            raise Exception('--max-items needs a constrained_ algorithm, got ' + algorithm)
+        params['max_items'] = args.max_items
+
+    outfile = args.outfile or default_outfile()
+    start_outfile(outfile)
+    if algorithm == 'ptas_awfd':
+        # The aggregator takes eps from the last marker line, so write one for every run even with the default
+        with open(outfile, 'a') as f:
+            f.write('Doing PTAS, eps={}\n'.format(params.get('epsilon', DEFAULT_EPSILON)))
+    pack_and_print(items, get_algorithm(algorithm), outfile, descending,
+                   improve_budget=args.improve, latency_every=args.latency_every, params=params)
+
+
+def sweep_command(args):
+    outfile = args.outfile or default_outfile()
+    start_outfile(outfile)
+    test_all(args.input_size, outfile)
+    test_ptas(args.input_size, outfile)
+
+
+def benchmark_command(args):
+    outfile = args.outfile or default_outfile()
+    start_outfile(outfile)
+    BENCHMARKS[args.name][0](args.input_size, outfile)
+
+
+def generate_command(args):
+    if args.seed is not None:
+        random.seed(args.seed)
+    lines = '\n'.join(repr(item) for item in random_list(args.count)) + '\n'
+    if args.output is None:
+        sys.stdout.write(lines)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(lines)
+
+
+def aggregate_command(args):
+    from aggregate import aggregate
+
+    added = aggregate(args.files, args.summary, args.state)
+    print('Added {} rows, wrote {}'.format(added, args.summary))
+
+
+def main(argv=None):
+    import argparse
+    from algorithms import ALGORITHMS
+
+    parser = argparse.ArgumentParser(description='Bin packing algorithms and experiments')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack = subparsers.add_parser('pack', help='Pack one instance and append the result to the output CSV')
+    pack.add_argument('--algorithm', default='best_fit', choices=sorted(ALGORITHMS) + ['auto'],
+                      help='auto picks the cheapest algorithm predicted to be within --max-gap of the lower bound')
+    pack.add_argument('--calibration', nargs='+', metavar='CSV',
+                      help='Training files from the selector benchmark to calibrate auto from')
+    pack.add_argument('--max-gap', type=float, default=0.02, help='Largest predicted SOL/LB - 1 auto will accept')
+    source = pack.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='File with one item weight per line, or - for stdin')
+    source.add_argument('--random', type=int, metavar='N', help='Pack N random items')
+    pack.add_argument('--descending', action='store_true', help='Sort items by non-increasing weight first')
+    pack.add_argument('--epsilon', type=float, help='Epsilon for ptas_awfd')
+    pack.add_argument('--max-items', type=int, help='Most items per bin, for the constrained_ algorithms')
+    pack.add_argument('--improve', type=float, metavar='SECONDS', help='Run local search for up to SECONDS after')
+    pack.add_argument('--latency-every', type=int, metavar='K', help='Record the latency of every K-th item')
+    pack.add_argument('--seed', type=int)
+    pack.add_argument('--outfile')
+    pack.set_defaults(func=pack_command)
+
+    sweep = subparsers.add_parser('sweep', help='Run every algorithm on 128 random instances, then the PTAS')
+    sweep.add_argument('--input-size', type=int, default=INPUT_SIZE)
+    sweep.add_argument('--outfile')
+    sweep.set_defaults(func=sweep_command)
+
+    benchmark = subparsers.add_parser('benchmark', help='Run one of the other experiments',
+                                      formatter_class=argparse.RawDescriptionHelpFormatter,
+                                      epilog='\n'.join('{}: {}'.format(name, note)
+                                                       for name, (function, note) in BENCHMARKS.items() if note))
+    benchmark.add_argument('name', choices=sorted(BENCHMARKS))
+    benchmark.add_argument('--input-size', type=int, default=INPUT_SIZE)
+    benchmark.add_argument('--outfile')
+    benchmark.set_defaults(func=benchmark_command)
+
+    generate = subparsers.add_parser('generate', help='Write random item weights, one per line')
+    generate.add_argument('count', type=int)
+    generate.add_argument('--output', help='Defaults to stdout')
+    generate.add_argument('--seed', type=int)
+    generate.set_defaults(func=generate_command)
+
+    aggregate = subparsers.add_parser('aggregate', help='Summarize result CSVs per (Algorithm, Descending?, n, eps)')
+    aggregate.add_argument('files', nargs='+')
+    aggregate.add_argument('--summary', default='summary.csv', help='Where to write the summary table')
+    aggregate.add_argument('--state', help='Saved statistics to update with only the new rows of files, if it exists')
+    aggregate.set_defaults(func=aggregate_command)
 
-test_all(INPUT_SIZE, OUTFILE)
-test_ptas(INPUT_SIZE, OUTFILE)
+    args = parser.parse_args(argv)
+    args.func(args)
 
-#for x in range(128):
-#    pack_and_print(random_list(INPUT_SIZE), almost_worst_fit, OUTFILE, True)
-#    pack_and_print(random_list(INPUT_SIZE), almost_worst_fit, OUTFILE, False)
 
-# FF is slow, reduce input size by order of mag.
-# worst_case_nf(math.ceil(INPUT_SIZE/10), OUTFILE)
-# worst_case_ff(math.ceil(INPUT_SIZE/10), OUTFILE)
+if __name__ == '__main__':
+    main()
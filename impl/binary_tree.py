@@ -236,17 +236,60 @@ class Node:
         return promote
 
 
+class NodePool:
+    """ Free-list of Nodes, so that a tree which is constantly inserting and removing (like the bin weight trees in
+    bin_pack) can reuse its Nodes and NodeKeys instead of allocating new ones and leaving the old ones to the GC
+    """
+    def __init__(self):
+        self.free = []
+
+    def acquire(self, value, name=None):
+        if not self.free:
+            return Node(value, name)
+
+        node = self.free.pop()
+        node.key.value = value
+        node.key.name = name
+        node.value = value
+        node.height = 0
+        return node
+
+    def release(self, node):
+        node.parent = None
+        node.left_child = None
+        node.right_child = None
+        self.free.append(node)
+
+
 class BinaryTree:
     """ Binary Search Tree
     Uses AVL Tree
     """
-    def __init__(self, *args):
+    def __init__(self, *args, pool=None):
         self.root = None  # root Node
         self.element_count = 0
+        # Optional NodePool to take Nodes from and return them to
+        self.pool = pool
         if len(args) == 1:
             for i in args[0]:
                 self.insert(i)
 
+    def clear(self):
+        """ Remove all elements, so the tree can be reused
+        If the tree has a pool, all its Nodes are returned to it
+        """
+        if self.pool is not None and self.root is not None:
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                if node.left_child is not None:
+                    stack.append(node.left_child)
+                if node.right_child is not None:
+                    stack.append(node.right_child)
+                self.pool.release(node)
+        self.root = None
+        self.element_count = 0
+
     def __len__(self):
         return self.element_count
 
@@ -271,12 +314,18 @@ class BinaryTree:
         #print('Insert {}, {}'.format(name, value))
         if self.root is None:
             # If nothing in tree
-            self.root = Node(value, name)
+            self.root = self._new_node(value, name)
+            self.element_count += 1
         else:
             if self.find(NodeKey(value, name)) is None:
                 # If key/name pair doesn't exist in tree
                 self.element_count += 1
-                self.add_as_child(self.root, Node(value, name))
+                self.add_as_child(self.root, self._new_node(value, name))
+
+    def _new_node(self, value, name):
+        if self.pool is None:
+            return Node(value, name)
+        return self.pool.acquire(value, name)
 
     def add_as_child(self, parent_node, child_node):
         if child_node.key < parent_node.key:
@@ -430,6 +479,9 @@ class BinaryTree:
                 #print('2 childs')
                 assert node.left_child and node.right_child
                 self.swap_with_successor_and_remove(node)
+
+            if self.pool is not None:
+                self.pool.release(node)
         else:
             raise Exception('Tried to remove nonexistent key ' + str(key))
 
@@ -471,6 +523,13 @@ class BinaryTree:
                 assert node.right_child
                 node.right_child.parent = parent
             parent.update_height()
+        else:
+            # Removing the root, so its only child becomes the new root
+            if node.left_child is not None:
+                self.root = node.left_child
+            else:
+                self.root = node.right_child
+            self.root.parent = None
 
         # rebalance
         node = parent
@@ -554,6 +613,15 @@ class BinaryTree:
             current = current.left_child
         return current
 
+    def max(self):
+        current = self.root
+        if current is None:
+            return None
+
+        while current.right_child is not None:
+            current = current.right_child
+        return current
+
     def second_min(self):
         min = self.min()
         if min is None:
@@ -0,0 +1,243 @@
+"""
+First Fit and Best Fit with two extra constraints on top of the bin capacity:
+    max_items: No bin may hold more than this many items
+    conflicts: Pairs of items that may not share a bin
+Checking these against Bin.items for every candidate bin would make each placement a scan. Instead, bins that reach
+max_items are dropped from the search structure, so every bin it returns has a free slot, and an item's conflicts are
+turned into the set of bins its already placed neighbours are in, so ruling a bin out is one hash lookup. Only bins in
+that set are ever skipped, so placing an item costs O((1 + conflicts of the item) * logn).
+"""
+from time import perf_counter_ns
+
+from bin_pack import Bin, _new_bin, _new_tree
+
+
+class BinWeightSegmentTree:
+    """
+    Min segment tree over the weights of the bins, in the order they were opened. Finds the leftmost bin an item fits
+    into, ie. the bin First Fit would choose, in O(logn).
+    """
+
+    # Weight of bins that can't take any more items
+    CLOSED = float('inf')
+
+    def __init__(self):
+        # Number of leaves, always a power of two. Node i has children 2i and 2i+1, leaf j is node size + j.
+        self.size = 1
+        self.tree = [self.CLOSED] * 2
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, weight):
+        """
+        Add a bin after the existing ones.
+        :return: Its index
+        """
+        if self.count == self.size:
+            # Double the leaves and rebuild, amortized O(1) per bin
+            leaves = self.tree[self.size:] + [self.CLOSED] * self.size
+            self.size *= 2
+            self.tree = [self.CLOSED] * self.size + leaves
+            for i in range(self.size - 1, 0, -1):
+                self.tree[i] = min(self.tree[2 * i], self.tree[2 * i + 1])
+
+        index = self.count
+        self.count += 1
+        self.update(index, weight)
+        return index
+
+    def get(self, index):
+        return self.tree[self.size + index]
+
+    def update(self, index, weight):
+        i = self.size + index
+        self.tree[i] = weight
+        i //= 2
+        while i > 0:
+            self.tree[i] = min(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+    def leftmost_fit(self, item_weight):
+        """
+        :return: The index of the first bin with room for the item, or None if there isn't one
+        """
+        # Same test as Bin.has_room, so the result agrees with it exactly
+        if Bin.CAPACITY - (self.tree[1] + item_weight) < 0:
+            return None
+        i = 1
+        while i < self.size:
+            i *= 2
+            if Bin.CAPACITY - (self.tree[i] + item_weight) < 0:
+                i += 1
+        return i - self.size
+
+
+def _prepare(items, decreasing, max_items, conflicts):
+    """
+    Sort the items if decreasing, and index the conflicts by the items' names (their index in the sorted list).
+    :param conflicts: Pairs of indices into items, as given, ie. before sorting
+    :return: A list where entry i is the names of the items before item i that conflict with it
+    """
+    if max_items is not None and max_items < 1:
+        raise Exception('max_items must be at least 1, got ' + str(max_items))
+
+    names = list(range(len(items)))
+    if decreasing:
+        names.sort(key=items.__getitem__, reverse=True)
+        items[:] = [items[i] for i in names]
+        # Index before sorting -> name
+        renamed = [0] * len(names)
+        for name, index in enumerate(names):
+            renamed[index] = name
+        names = renamed
+
+    # Items are placed in name order, so when placing an item only its conflicts with smaller names matter
+    earlier = [[] for x in range(len(items))]
+    for a, b in conflicts:
+        if a == b:
+            raise Exception('Item {} cannot conflict with itself'.format(a))
+        a, b = names[a], names[b]
+        if a < b:
+            earlier[b].append(a)
+        else:
+            earlier[a].append(b)
+    return earlier
+
+
+def constrained_first_fit(items, decreasing, pool=None, sampler=None, max_items=None, conflicts=()):
+    """
+    Runtime: O((n + number of conflicts) * logn)
+    :param items: List of item weights, each less than Bin.CAPACITY
+    :param decreasing: Whether or not to sort the items by non-increasing weights before packing
+    :param max_items: The most items a bin may hold, or None for no limit
+    :param conflicts: Iterable of (i, j) pairs of indices into items, as given, that may not share a bin
+    :return: A list of 'bins', each a list of items contained in that bin.
+    """
+    earlier = _prepare(items, decreasing, max_items, conflicts)
+
+    bins = []
+    # Bin of each item placed so far
+    item_bins = [0] * len(items)
+    bin_weights = BinWeightSegmentTree()
+
+    countdown = 0 if sampler is None else 1
+    for item, weight in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
+
+        # Hide the bins of conflicting items from the search while placing this one
+        blocked = {item_bins[other] for other in earlier[item]}
+        hidden = [(index, bin_weights.get(index)) for index in blocked]
+        for index, bin_weight in hidden:
+            bin_weights.update(index, BinWeightSegmentTree.CLOSED)
+        index = bin_weights.leftmost_fit(weight)
+        for blocked_index, bin_weight in hidden:
+            bin_weights.update(blocked_index, bin_weight)
+
+        if index is None:
+            b = _new_bin(len(bins), pool)
+            if not b.try_add_item(item, weight):
+                raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
+            bins.append(b)
+            index = bin_weights.append(b.weight)
+        else:
+            b = bins[index]
+            if not b.try_add_item(item, weight):
+                raise Exception('Error! First bin did not have room for item!')
+
+        if max_items is not None and len(b.items) >= max_items:
+            bin_weights.update(index, BinWeightSegmentTree.CLOSED)
+        else:
+            bin_weights.update(index, b.weight)
+        item_bins[item] = index
+
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
+    return bins
+
+
+def _heaviest_fit(bin_weights, item_weight):
+    """
+    :return: The last node (in key order) of the tree whose bin has room for the item, or None. Unlike
+             BinaryTree.find_largest_lessthan this doesn't stop at the first node of the right weight, so walking back
+             from it with Node.previous() visits every bin with room.
+    """
+    node = bin_weights.root
+    best = None
+    while node is not None:
+        if Bin.CAPACITY - (node.key.value + item_weight) >= 0:
+            best = node
+            node = node.right_child
+        else:
+            node = node.left_child
+    return best
+
+
+def constrained_best_fit(items, decreasing, pool=None, sampler=None, max_items=None, conflicts=()):
+    """
+    Runtime: O((n + number of conflicts) * logn)
+    Parameters are the same as constrained_first_fit.
+    """
+    earlier = _prepare(items, decreasing, max_items, conflicts)
+
+    bins = []
+    item_bins = [0] * len(items)
+    # The tree nodes' VALUES are the bin weight, NAMES are the bin index (in bins[]). Bins with max_items items are
+    # removed, since nothing more can go in them.
+    bin_weights = _new_tree(pool)
+
+    countdown = 0 if sampler is None else 1
+    for item, weight in enumerate(items):
+        countdown -= 1
+        if countdown == 0:
+            started = perf_counter_ns()
+
+        # Walk down from the heaviest bin with room to the heaviest one without a conflicting item. Only the bins in
+        # blocked are skipped.
+        node = _heaviest_fit(bin_weights, weight)
+        blocked = {item_bins[other] for other in earlier[item]}
+        while node is not None and node.key.name in blocked:
+            node = node.previous()
+
+        if node is None:
+            b = _new_bin(len(bins), pool)
+            if not b.try_add_item(item, weight):
+                raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
+            bins.append(b)
+        else:
+            b = bins[node.key.name]
+            if not b.try_add_item(item, weight):
+                raise Exception('Error! Best bin did not have room for item!')
+            bin_weights.remove(node.key)
+
+        if max_items is None or len(b.items) < max_items:
+            bin_weights.insert(b.weight, b.name)
+        item_bins[item] = b.name
+
+        if countdown == 0:
+            countdown = sampler.record(perf_counter_ns() - started)
+
+    bin_weights.clear()
+    return bins
+
+
+def violations(bins, max_items=None, conflicts=()):
+    """
+    Check a packing against the constraints by scanning every bin, eg. to test the algorithms above.
+    :param conflicts: Pairs of item names
+    :return: The number of bins over capacity or max_items, plus the number of conflicting pairs sharing a bin
+    """
+    count = 0
+    item_bins = {}
+    for index, b in enumerate(bins):
+        if not b.weight <= Bin.CAPACITY or (max_items is not None and len(b.items) > max_items):
+            count += 1
+        for name, weight in b.items:
+            item_bins[name] = index
+    for a, b in conflicts:
+        if item_bins[a] == item_bins[b]:
+            count += 1
+    return count
@@ -0,0 +1,169 @@
+import math
+from timeit import default_timer as timer
+
+from bin_pack import Bin
+from binary_tree import BinaryTree, NodeKey
+
+
+class DynamicPacker:
+    """
+    Best Fit packing where items can also leave. Departures leave holes in bins, so once the fraction of bins above
+    the lower bound (the fragmentation) passes a threshold, the lightest bins are emptied and their items are packed
+    into the others again.
+    Compaction only runs once at least as many items have left since the last one as it empties bins, so it costs
+    O(items per bin * logn) per delete, amortized. Emptying the lightest bins nearly always helps for a moment, so a
+    compaction is judged by whether it leaves the fragmentation lower than the previous one did. One that doesn't
+    doubles the number of deletes needed before the next, so a steady state that stays above the threshold isn't
+    repacked over and over.
+    """
+
+    def __init__(self, fragmentation_threshold=0.1, repack_fraction=0.05, pool=None):
+        """
+        :param fragmentation_threshold: Compact when 1 - (lower bound / bins in use) is larger than this
+        :param repack_fraction: The fraction of bins, lightest first, to empty and repack per compaction
+        :param pool: Optional bin_pack.BinPool to take Bins and tree nodes from
+        """
+        self.fragmentation_threshold = fragmentation_threshold
+        self.repack_fraction = repack_fraction
+        self.pool = pool
+
+        # Bin name -> Bin, for every bin that has items in it
+        self.bins = {}
+        # Item id -> (bin name, item tuple in that bin's items)
+        self.item_bins = {}
+        # The tree nodes' VALUES are the bin weight, NAMES are the bin name
+        if pool is None:
+            self.bin_weights = BinaryTree()
+        else:
+            self.bin_weights = BinaryTree(pool=pool.nodes)
+
+        self.total_weight = 0
+        self.next_item_id = 0
+        self.next_bin_name = 0
+        self.deletes_since_compaction = 0
+        # Multiplies the deletes needed between compactions. Doubled by every compaction that doesn't help.
+        self.backoff = 1
+        # Fragmentation right after the last compaction
+        self.compacted_fragmentation = 1
+        self.compactions = 0
+        self.moved_items = 0
+
+    def __len__(self):
+        return len(self.bins)
+
+    def lower_bound(self):
+        return math.ceil(round(self.total_weight, 9) / Bin.CAPACITY)
+
+    def fragmentation(self):
+        if not self.bins:
+            return 0
+        return 1 - self.lower_bound() / len(self.bins)
+
+    def insert(self, weight):
+        """
+        Pack a new item using Best Fit.
+        :return: The id of the item, to pass to delete()
+        """
+        item_id = self.next_item_id
+        self.next_item_id += 1
+        self._place(item_id, weight)
+        self.total_weight += weight
+        return item_id
+
+    def delete(self, item_id):
+        if item_id not in self.item_bins:
+            raise Exception('Tried to delete nonexistent item ' + str(item_id))
+
+        bin_name, item = self.item_bins.pop(item_id)
+        b = self.bins[bin_name]
+        self.bin_weights.remove(NodeKey(b.weight, bin_name))
+        b.remove_item(item)
+        self.total_weight -= item[1]
+        if b.items:
+            self.bin_weights.insert(b.weight, bin_name)
+        else:
+            self._close_bin(b)
+
+        self.deletes_since_compaction += 1
+        if self.fragmentation() > self.fragmentation_threshold and \
+                self.deletes_since_compaction >= self._repack_count() * self.backoff:
+            self.compact()
+
+    def compact(self):
+        """
+        Empty the lightest bins and pack their items into the rest with Best Fit Decreasing.
+        """
+        items = []
+        for x in range(self._repack_count()):
+            node = self.bin_weights.min()
+            if node is None:
+                break
+            b = self.bins[node.key.name]
+            self.bin_weights.remove(node.key)
+            items.extend(b.items)
+            self._close_bin(b)
+
+        items.sort(key=lambda item: item[1], reverse=True)
+        for item_id, weight in items:
+            self._place(item_id, weight)
+
+        self.moved_items += len(items)
+        self.compactions += 1
+        self.deletes_since_compaction = 0
+        fragmentation = self.fragmentation()
+        if fragmentation < self.compacted_fragmentation:
+            self.backoff = 1
+        else:
+            self.backoff *= 2
+        self.compacted_fragmentation = fragmentation
+
+    def _repack_count(self):
+        return max(1, int(len(self.bins) * self.repack_fraction))
+
+    def _place(self, item_id, weight):
+        best_bin_node = self.bin_weights.find_largest_lessthan(Bin.CAPACITY - weight)
+        if best_bin_node is not None and self.bins[best_bin_node.key.name].has_room(weight):
+            b = self.bins[best_bin_node.key.name]
+            self.bin_weights.remove(best_bin_node.key)
+        else:
+            b = self._open_bin()
+
+        if not b.try_add_item(item_id, weight):
+            raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
+        self.item_bins[item_id] = (b.name, b.items[-1])
+        self.bin_weights.insert(b.weight, b.name)
+
+    def _open_bin(self):
+        if self.pool is None:
+            b = Bin(self.next_bin_name)
+        else:
+            b = self.pool.new_bin(self.next_bin_name)
+        self.next_bin_name += 1
+        self.bins[b.name] = b
+        return b
+
+    def _close_bin(self, b):
+        del self.bins[b.name]
+        if self.pool is not None:
+            self.pool.release([b])
+
+
+def replay(trace, packer, sample_every=1000):
+    """
+    Replay an arrival/departure trace.
+    :param trace: List of (True, weight) for an arrival and (False, n) for the departure of the n'th arrival
+    :param packer: The DynamicPacker to replay into. It should be empty, so that item ids match arrival order.
+    :param sample_every: Record the number of bins in use after every sample_every events
+    :return: (elapsed, samples) - the seconds taken, and a list of (event index, bins in use, lower bound)
+    """
+    samples = []
+    t = timer()
+    for index, (arrival, value) in enumerate(trace):
+        if arrival:
+            packer.insert(value)
+        else:
+            packer.delete(value)
+        if index % sample_every == 0:
+            samples.append((index, len(packer), packer.lower_bound()))
+    elapsed = timer() - t
+    return elapsed, samples
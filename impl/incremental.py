@@ -0,0 +1,198 @@
+from bin_pack import Bin
+from binary_tree import BinaryTree, NodeKey
+
+
+class IncrementalPacker:
+    """
+    Keeps a packing up to date as items are added and removed, instead of re-running the algorithm from scratch.
+    Only the bins that lose items, and the bins Best Fit picks for new items, are touched. Lookups go through a tree of
+    bin weights, so a delta of d items costs O(d*logn) plus the items moved out of emptied bins.
+
+    Guarantee: after every apply(), at most one bin is at most half full (any two such bins are merged). So the
+    packing never uses more than 2 * ceil(total weight) + 1 bins, ie. at most 2 * OPT + 1, like any fresh Any Fit
+    packing. The one exception is rounding in the bin weights, which can leave two bins that each weigh about half
+    but whose items don't quite fit together; those are left as they are. In practice it stays close to a fresh Best
+    Fit Decreasing run, see test_incremental in bin_pack_main.
+    """
+
+    def __init__(self, bins):
+        """
+        :param bins: A previous packing, as a list of Bins from any algorithm. Item names must be unique.
+        """
+        # Bins by position. Emptied bins are set to None.
+        self.bins = list(bins)
+        # Item name -> position of the bin it is in
+        self.item_bins = {}
+        # The tree nodes' VALUES are the bin weight, NAMES are the bin position in self.bins
+        self.bin_weights = BinaryTree()
+
+        self.next_name = 0
+        for position, b in enumerate(self.bins):
+            self.bin_weights.insert(b.weight, position)
+            for name, weight in b.items:
+                if name in self.item_bins:
+                    raise Exception('Item name {} is not unique'.format(name))
+                self.item_bins[name] = position
+                if isinstance(name, int):
+                    self.next_name = max(self.next_name, name + 1)
+
+        self._merge_half_empty_bins()
+
+    @staticmethod
+    def from_assignment(weights, assignment):
+        """
+        Build from a compact packing, where item i has weight weights[i] and is in bin assignment[i].
+        """
+        bins = [Bin(index) for index in range(max(assignment) + 1 if assignment else 0)]
+        for name, (weight, index) in enumerate(zip(weights, assignment)):
+            if not bins[index].try_add_item(name, weight):
+                raise Exception('Bin {} is over capacity'.format(index))
+        return IncrementalPacker([b for b in bins if b.items])
+
+    def __len__(self):
+        return len(self.bin_weights)
+
+    def to_bins(self):
+        return [b for b in self.bins if b is not None]
+
+    def assignment(self):
+        """
+        :return: dict of item name -> index of its bin in to_bins()
+        """
+        indices = {}
+        for b in self.bins:
+            if b is not None:
+                indices[id(b)] = len(indices)
+        return {name: indices[id(self.bins[position])] for name, position in self.item_bins.items()}
+
+    def apply(self, added=(), removed=()):
+        """
+        :param added: Weights of the new items
+        :param removed: Names of the items to remove
+        :return: The names given to the added items, in the same order
+        """
+        touched = set()
+        for name in removed:
+            if name not in self.item_bins:
+                raise Exception('Tried to remove nonexistent item ' + str(name))
+            position = self.item_bins.pop(name)
+            b = self.bins[position]
+            self.bin_weights.remove(NodeKey(b.weight, position))
+            for item in b.items:
+                if item[0] == name:
+                    b.remove_item(item)
+                    break
+            if b.items:
+                self.bin_weights.insert(b.weight, position)
+                touched.add(position)
+            else:
+                self.bins[position] = None
+
+        # Try to empty the bins that lost items, lightest first, before adding anything to them
+        touched = [position for position in touched if self.bins[position] is not None]
+        for position in sorted(touched, key=lambda p: self.bins[p].weight):
+            if self.bins[position].weight <= Bin.CAPACITY / 2:
+                self._try_empty(position)
+
+        names = list(range(self.next_name, self.next_name + len(added)))
+        self.next_name += len(added)
+        # Best Fit Decreasing for the new items
+        for name, weight in sorted(zip(names, added), key=lambda item: item[1], reverse=True):
+            self._place(name, weight)
+
+        self._merge_half_empty_bins()
+        return names
+
+    def _place(self, name, weight):
+        """
+        Put an item into the best fitting bin, or a new one.
+        """
+        node = self.bin_weights.find_largest_lessthan(Bin.CAPACITY - weight)
+        if node is not None and self.bins[node.key.name].has_room(weight):
+            position = node.key.name
+            self.bin_weights.remove(node.key)
+        else:
+            position = len(self.bins)
+            self.bins.append(Bin(position))
+
+        b = self.bins[position]
+        if not b.try_add_item(name, weight):
+            raise Exception('Error! Could not add item into empty bin. Is the item larger than the bin?')
+        self.bin_weights.insert(b.weight, position)
+        self.item_bins[name] = position
+
+    def _try_empty(self, position):
+        """
+        Move every item of the given bin into other existing bins with Best Fit, or leave it unchanged if they don't all
+        fit.
+        """
+        b = self.bins[position]
+        self.bin_weights.remove(NodeKey(b.weight, position))
+
+        moves = []
+        for item in sorted(b.items, key=lambda i: i[1], reverse=True):
+            node = self.bin_weights.find_largest_lessthan(Bin.CAPACITY - item[1])
+            if node is None or not self.bins[node.key.name].has_room(item[1]):
+                break
+            target_position = node.key.name
+            target = self.bins[target_position]
+            self.bin_weights.remove(node.key)
+            if not target.try_add_item(item[0], item[1]):
+                raise Exception('Error! Best bin did not have room for item!')
+            self.bin_weights.insert(target.weight, target_position)
+            moves.append((item, target_position))
+        else:
+            for item, target_position in moves:
+                self.item_bins[item[0]] = target_position
+            self.bins[position] = None
+            return True
+
+        # Undo
+        for item, target_position in moves:
+            target = self.bins[target_position]
+            self.bin_weights.remove(NodeKey(target.weight, target_position))
+            target.remove_item(item)
+            self.bin_weights.insert(target.weight, target_position)
+        self.bin_weights.insert(b.weight, position)
+        return False
+
+    def _merge_half_empty_bins(self):
+        """
+        While the two lightest bins are both at most half full, move the lighter's items into the other.
+        """
+        while len(self.bin_weights) > 1:
+            lightest = self.bin_weights.min()
+            second = self.bin_weights.second_min()
+            if second is None or self.bins[second.key.name].weight > Bin.CAPACITY / 2:
+                return
+
+            source_position = lightest.key.name
+            target_position = second.key.name
+            source = self.bins[source_position]
+            target = self.bins[target_position]
+            # Check that every item fits before moving any. Rounding in remove_item can leave two bins that each
+            # weigh at most half whose items don't add up to fit in one, so then there is nothing to merge.
+            merged_weight = target.weight
+            for name, weight in source.items:
+                if Bin.CAPACITY - (merged_weight + weight) < 0:
+                    return
+                merged_weight += weight
+
+            self.bin_weights.remove(NodeKey(source.weight, source_position))
+            self.bin_weights.remove(NodeKey(target.weight, target_position))
+            for name, weight in source.items:
+                if not target.try_add_item(name, weight):
+                    raise Exception('Error! Could not merge bin {} into bin {}'.format(source_position, target_position))
+                self.item_bins[name] = target_position
+            self.bins[source_position] = None
+            self.bin_weights.insert(target.weight, target_position)
+
+
+def repack(bins, added=(), removed=()):
+    """
+    One-off incremental repack of a previous packing.
+    :return: (bins, names of the added items)
+    """
+    packer = IncrementalPacker(bins)
+    names = packer.apply(added, removed)
+    return packer.to_bins(), names
@@ -0,0 +1,91 @@
+class LatencyHistogram:
+    """
+    HDR-style histogram of latencies in nanoseconds. Values below 2 * SUB_BUCKETS are counted exactly, and above
+    that each power of two is split into SUB_BUCKETS linear buckets, so the relative error of a reported percentile is
+    at most 1 / SUB_BUCKETS no matter how large the value is. Recording is O(1) and the memory used only grows with
+    the log of the largest value.
+    """
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = []
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < 2 * self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - (self.SUB_BUCKET_BITS + 1)
+        return shift * self.SUB_BUCKETS + (value >> shift)
+
+    def _highest_value(self, index):
+        """
+        Returns the largest value that falls into the bucket at the given index
+        """
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        mantissa = index - shift * self.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        index = self._index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        :param percent: eg. 99.9 for the p999
+        :return: The latency in ns that percent of the recorded values are at or below, or 0 if nothing was recorded
+        """
+        if self.total == 0:
+            return 0
+        # The number of values at or below the percentile, rounding up so that p100 is the max
+        target = max(1, -(-self.total * percent // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :return: (p50, p99, p999, max) in ns
+        """
+        return self.percentile(50), self.percentile(99), self.percentile(99.9), self.max
+
+
+class LatencySampler:
+    """
+    Records the placement latency of every k-th item into a LatencyHistogram. Algorithms in bin_pack take one as
+    sampler=. To keep the cost for the items that aren't sampled to one decrement and compare, the loops count down
+    to the next sampled item themselves, and only read the timer for sampled ones:
+        countdown = 0 if sampler is None else 1
+        for ...:
+            countdown -= 1
+            if countdown == 0:
+                started = perf_counter_ns()
+            ... place the item ...
+            if countdown == 0:
+                countdown = sampler.record(perf_counter_ns() - started)
+    Starting from 0 (no sampler), the countdown goes negative and never reaches 0 again.
+    """
+    def __init__(self, every=1):
+        if every < 1:
+            raise Exception('Must sample at least every 1 items, not ' + str(every))
+        self.every = every
+        self.histogram = LatencyHistogram()
+
+    def record(self, latency):
+        """
+        Record one sampled item's latency in ns.
+        :return: The number of items until the next one to sample
+        """
+        self.histogram.record(latency)
+        return self.every
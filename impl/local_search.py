@@ -0,0 +1,126 @@
+from timeit import default_timer as timer
+
+from binary_tree import BinaryTree, NodeKey
+
+# How many of the lightest bins to look at when searching for a swap partner
+SWAP_CANDIDATES = 8
+
+
+def improve(bins, time_budget=1.0):
+    """
+    Local search improvement stage, which can be run on the bins returned by any algorithm in bin_pack.
+    Starting from the least-full bin, tries to empty each bin by moving its items into the other bins (Best Fit, using
+    a tree of bin weights for O(logn) target lookup), or by swapping them with smaller items from other bins.
+    Passes are repeated until one saves no bins or the time budget runs out.
+    :param bins: List of Bins. The Bins are modified in place.
+    :param time_budget: Maximum number of seconds to spend. A move that is in progress when the budget runs out is
+                        still finished.
+    :return: (bins, saved, elapsed) - the list of non-empty bins, the number of bins that were emptied, and the
+             number of seconds spent
+    """
+    start = timer()
+    # The tree nodes' VALUES are the bin weight, NAMES are the bin index in bins[]
+    bin_weights = BinaryTree()
+    for index, b in enumerate(bins):
+        bin_weights.insert(b.weight, index)
+
+    emptied = set()
+    out_of_time = False
+    while not out_of_time:
+        saved_this_pass = 0
+        order = sorted((index for index in range(len(bins)) if index not in emptied), key=lambda i: bins[i].weight)
+        for index in order:
+            if timer() - start > time_budget:
+                out_of_time = True
+                break
+            if _try_empty_bin(bins, index, bin_weights):
+                emptied.add(index)
+                saved_this_pass += 1
+        if saved_this_pass == 0:
+            break
+
+    remaining = [b for index, b in enumerate(bins) if index not in emptied]
+    return remaining, len(emptied), timer() - start
+
+
+def _try_empty_bin(bins, source_index, bin_weights):
+    """
+    Try to move every item out of bins[source_index]. If that fails, all changes are undone.
+    :return: True if the bin was emptied. The bin is then no longer in bin_weights.
+    """
+    source = bins[source_index]
+    capacity = source.CAPACITY
+    # The source can't be a target for its own items
+    bin_weights.remove(NodeKey(source.weight, source_index))
+
+    # bin index -> (items, weight) before we touched it, so the whole attempt can be rolled back
+    snapshots = {source_index: (list(source.items), source.weight)}
+
+    def update(index, item_to_remove, item_to_add):
+        b = bins[index]
+        if index not in snapshots:
+            snapshots[index] = (list(b.items), b.weight)
+        bin_weights.remove(NodeKey(b.weight, index))
+        if item_to_remove is not None:
+            b.remove_item(item_to_remove)
+        if not b.try_add_item(item_to_add[0], item_to_add[1]):
+            raise Exception('Error! Target bin did not have room for item!')
+        bin_weights.insert(b.weight, index)
+
+    # Place the largest items first, they are the hardest to fit
+    pending = sorted(source.items, key=lambda item: item[1], reverse=True)
+    while pending:
+        item = pending.pop(0)
+        weight = item[1]
+
+        target_node = bin_weights.find_largest_lessthan(capacity - weight)
+        if target_node is not None and bins[target_node.key.name].has_room(weight):
+            source.remove_item(item)
+            update(target_node.key.name, None, item)
+            continue
+
+        swap = _find_swap(bins, bin_weights, weight)
+        if swap is None:
+            _rollback(bins, source_index, bin_weights, snapshots)
+            return False
+
+        target_index, smaller_item = swap
+        source.remove_item(item)
+        update(target_index, smaller_item, item)
+        if not source.try_add_item(smaller_item[0], smaller_item[1]):
+            raise Exception('Error! Source bin did not have room for swapped item!')
+        # The source is now lighter. Try to move the item we swapped in out of it, too.
+        pending.append(smaller_item)
+        pending.sort(key=lambda i: i[1], reverse=True)
+
+    return True
+
+
+def _find_swap(bins, bin_weights, weight):
+    """
+    Look through the lightest bins for an item that is smaller than weight, and can be swapped out for it.
+    :return: (bin index, item) for the largest such item in the first bin that has one, or None.
+    """
+    node = bin_weights.min()
+    for x in range(SWAP_CANDIDATES):
+        if node is None:
+            return None
+        b = bins[node.key.name]
+        best = None
+        for item in b.items:
+            if item[1] < weight and b.has_room(weight - item[1]) and (best is None or item[1] > best[1]):
+                best = item
+        if best is not None:
+            return node.key.name, best
+        node = node.next()
+    return None
+
+
+def _rollback(bins, source_index, bin_weights, snapshots):
+    for index, (items, weight) in snapshots.items():
+        b = bins[index]
+        if index != source_index:
+            bin_weights.remove(NodeKey(b.weight, index))
+        b.items = items
+        b.weight = weight
+        bin_weights.insert(weight, index)
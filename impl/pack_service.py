@@ -0,0 +1,273 @@
+"""
+Local packing service. Clients send one JSON request per line:
+    {"weights": [0.5, 0.25, ...], "algorithm": "best_fit", "descending": true}
+and get one JSON response per line, in the same order:
+    {"bins": 2, "assignment": [0, 1, ...]}
+where assignment[i] is the bin weights[i] was packed into, or {"error": "..."} if the request was bad.
+
+Requests that arrive close together are collected into micro-batches, grouped by algorithm and descending, and each
+group is packed in one call in a worker process. This amortizes the process pool round trip across requests.
+
+Run the server with
+    python pack_service.py serve --port 8765
+and generate load against it with
+    python pack_service.py load --port 8765 --connections 32
+"""
+import argparse
+import asyncio
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+
+from algorithms import get_algorithm
+from batch_pack import BatchPacker
+from bin_pack import Bin
+from latency import LatencyHistogram
+
+# Algorithms the service will run. The ones in BatchPacker.ALGORITHMS go through it, the rest call bin_pack directly.
+ALGORITHMS = BatchPacker.ALGORITHMS + ['bucket_best_fit', 'k_bounded_first_fit', 'k_bounded_best_fit',
+                                       'k_bounded_worst_fit']
+
+# Longest request or response line in bytes, instead of asyncio's default of 64 KiB (about 3.5k weights)
+LINE_LIMIT = 64 * 2 ** 20
+
+
+def _pack_group(algorithm, descending, instances):
+    """
+    Runs in a worker process. Packs every instance (a list of weights) with the same algorithm.
+    :return: A list of (bin count, assignment) per instance
+    """
+    if algorithm in BatchPacker.ALGORITHMS:
+        offsets = [0]
+        weights = []
+        for items in instances:
+            weights.extend(items)
+            offsets.append(len(weights))
+        bin_counts, assignments = BatchPacker().pack(weights, offsets, algorithm, descending)
+        return [(bin_counts[i], assignments[offsets[i]:offsets[i + 1]].tolist()) for i in range(len(instances))]
+
+    results = []
+    for items in instances:
+        # The algorithms name items by their index in the (sorted) list they are given, so sort here to be able to
+        # map the names back to the request's order
+        order = list(range(len(items)))
+        if descending:
+            order.sort(key=items.__getitem__, reverse=True)
+        bins = get_algorithm(algorithm)([items[i] for i in order], False)
+
+        assignment = [0] * len(items)
+        for bin_index, b in enumerate(bins):
+            for name, weight in b.items:
+                assignment[order[name]] = bin_index
+        results.append((len(bins), assignment))
+    return results
+
+
+def parse_request(line):
+    """
+    :return: (weights, algorithm, descending)
+    """
+    request = json.loads(line)
+    weights = request['weights']
+    algorithm = request.get('algorithm', 'best_fit')
+    descending = bool(request.get('descending', False))
+
+    if algorithm not in ALGORITHMS:
+        raise ValueError('Unknown algorithm ' + str(algorithm))
+    if not isinstance(weights, list) or \
+            not all(isinstance(w, (int, float)) and 0 < w <= Bin.CAPACITY for w in weights):
+        raise ValueError('weights must be a list of numbers in (0, {}]'.format(Bin.CAPACITY))
+    return [float(w) for w in weights], algorithm, descending
+
+
+class Batcher:
+    """
+    Collects requests for up to window seconds (or until there are batch_size of them), then dispatches them to the
+    process pool, one call per (algorithm, descending) group.
+    """
+
+    def __init__(self, executor, batch_size=64, window=0.002):
+        self.executor = executor
+        self.batch_size = batch_size
+        self.window = window
+        self.queue = asyncio.Queue()
+        # The event loop only keeps weak references to tasks, so the running _dispatch tasks are kept here
+        self.dispatches = set()
+
+    async def pack(self, weights, algorithm, descending):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((algorithm, descending, weights, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups = {}
+            for algorithm, descending, weights, future in batch:
+                groups.setdefault((algorithm, descending), []).append((weights, future))
+            for (algorithm, descending), requests in groups.items():
+                task = asyncio.create_task(self._dispatch(algorithm, descending, requests))
+                self.dispatches.add(task)
+                task.add_done_callback(self.dispatches.discard)
+
+    async def _dispatch(self, algorithm, descending, requests):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, _pack_group, algorithm, descending,
+                                                 [weights for weights, future in requests])
+        except Exception as e:
+            for weights, future in requests:
+                future.set_exception(e)
+            return
+        for (weights, future), result in zip(requests, results):
+            future.set_result(result)
+
+
+async def _read_line(reader):
+    """
+    :return: The next line, b'' at the end of the stream, or None if the line was over the reader's limit. The rest of
+             a line that is too long is skipped, so the next call reads the line after it.
+    """
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError:
+        pass
+
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            return None
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+        except asyncio.IncompleteReadError:
+            return b''
+
+
+async def _handle_connection(batcher, reader, writer):
+    try:
+        while True:
+            line = await _read_line(reader)
+            if line == b'':
+                break
+            try:
+                if line is None:
+                    raise ValueError('Request is over {} bytes'.format(LINE_LIMIT))
+                weights, algorithm, descending = parse_request(line)
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'error': str(e)}
+            else:
+                try:
+                    bins, assignment = await batcher.pack(weights, algorithm, descending)
+                    response = {'bins': bins, 'assignment': assignment}
+                except Exception as e:
+                    # Anything the worker raised, or a broken pool. Reply anyway, so the client isn't left waiting.
+                    response = {'error': '{}: {}'.format(type(e).__name__, e)}
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=8765, unix_path=None, workers=None, batch_size=64, window=0.002):
+    with ProcessPoolExecutor(workers) as executor:
+        batcher = Batcher(executor, batch_size, window)
+        batcher_task = asyncio.create_task(batcher.run())
+
+        def handler(reader, writer):
+            return _handle_connection(batcher, reader, writer)
+
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(handler, unix_path, limit=LINE_LIMIT)
+            print('Serving on ' + unix_path)
+        else:
+            server = await asyncio.start_server(handler, host, port, limit=LINE_LIMIT)
+            print('Serving on {}:{}'.format(host, port))
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+async def load_test(host='127.0.0.1', port=8765, unix_path=None, connections=32, requests=100, items=200,
+                    algorithm='best_fit', descending=True):
+    """
+    Open the given number of connections, and send requests random instances over each, one at a time.
+    :return: (requests/s, LatencyHistogram of request latencies in ns)
+    """
+    histogram = LatencyHistogram()
+
+    async def client():
+        if unix_path is not None:
+            reader, writer = await asyncio.open_unix_connection(unix_path, limit=LINE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        for x in range(requests):
+            weights = [random.uniform(0.001, 1) for i in range(items)]
+            line = json.dumps({'weights': weights, 'algorithm': algorithm, 'descending': descending})
+            started = timer()
+            writer.write((line + '\n').encode())
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            histogram.record(int((timer() - started) * 1e9))
+            if 'error' in response:
+                raise Exception('Server returned error: ' + response['error'])
+        writer.close()
+
+    started = timer()
+    await asyncio.gather(*[client() for x in range(connections)])
+    elapsed = timer() - started
+    return connections * requests / elapsed, histogram
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local bin packing service')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name in ['serve', 'load']:
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--host', default='127.0.0.1')
+        sub.add_argument('--port', type=int, default=8765)
+        sub.add_argument('--unix', help='Unix socket path to use instead of TCP')
+        if name == 'serve':
+            sub.add_argument('--workers', type=int, help='Number of worker processes, defaults to the CPU count')
+            sub.add_argument('--batch-size', type=int, default=64)
+            sub.add_argument('--batch-window-ms', type=float, default=2)
+        else:
+            sub.add_argument('--connections', type=int, default=32)
+            sub.add_argument('--requests', type=int, default=100, help='Requests per connection')
+            sub.add_argument('--items', type=int, default=200, help='Items per request')
+            sub.add_argument('--algorithm', default='best_fit', choices=ALGORITHMS)
+            sub.add_argument('--ascending', action='store_true', help="Don't sort items before packing")
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.batch_size,
+                          args.batch_window_ms / 1000))
+    else:
+        throughput, histogram = asyncio.run(load_test(args.host, args.port, args.unix, args.connections,
+                                                      args.requests, args.items, args.algorithm,
+                                                      not args.ascending))
+        p50, p99, p999, max_latency = histogram.summary()
+        print('{} requests/s, latency p50 {}ms, p99 {}ms, p999 {}ms, max {}ms'.format(
+            round(throughput, 1), round(p50 / 1e6, 3), round(p99 / 1e6, 3), round(p999 / 1e6, 3),
+            round(max_latency / 1e6, 3)))
+
+
+if __name__ == '__main__':
+    main()
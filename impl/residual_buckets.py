@@ -0,0 +1,58 @@
+import heapq
+
+
+class ResidualBuckets:
+    """
+    Groups bins into K buckets by residual capacity, for approximate Best Fit in O(log(bins per bucket)) time.
+    Bucket i holds the bins with residual capacity in [i * capacity / K, (i + 1) * capacity / K). Which buckets are
+    non-empty is tracked as bits of one int, so finding the next non-empty bucket above some bucket is a shift and a
+    lowest-set-bit on K bits rather than a walk over the buckets.
+    Each bucket is a heap with the roomiest bin on top, so if that one can't fit the item, no bin in the bucket can.
+    The chosen bin is then always in the same bucket as the bin exact Best Fit would choose, so it has less than
+    capacity / K (and so less than 2 * capacity / K) more room than that bin.
+    """
+
+    def __init__(self, buckets, capacity):
+        self.buckets = [[] for x in range(buckets)]
+        self.capacity = capacity
+        # Bit i is set if bucket i is non-empty
+        self.occupied = 0
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def _bucket_index(self, residual):
+        return min(len(self.buckets) - 1, int(residual * len(self.buckets) / self.capacity))
+
+    def add(self, residual, name):
+        """
+        Add the bin with the given name and residual capacity. Full bins are not added, since nothing can fit them.
+        """
+        if residual <= 0:
+            return
+        index = self._bucket_index(residual)
+        # Residuals are negated so the roomiest bin is at the top of the heap
+        heapq.heappush(self.buckets[index], (-residual, name))
+        self.occupied |= 1 << index
+
+    def pop_fit(self, weight):
+        """
+        Find a bin that can fit an item of the given weight, and remove it.
+        Only the roomiest bin in the item's own bucket needs to be tried, since the bins there may or may not have
+        room, but any bin in a higher bucket does.
+        :return: (residual, name) of the bin, or None if no bin can fit the item
+        """
+        index = self._bucket_index(weight)
+        bucket = self.buckets[index]
+        if not (bucket and -bucket[0][0] >= weight):
+            higher = self.occupied >> (index + 1)
+            if higher == 0:
+                return None
+            # Isolate the lowest set bit to find the nearest non-empty bucket
+            index += (higher & -higher).bit_length()
+            bucket = self.buckets[index]
+
+        residual, name = heapq.heappop(bucket)
+        if not bucket:
+            self.occupied &= ~(1 << index)
+        return -residual, name
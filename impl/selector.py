@@ -0,0 +1,226 @@
+"""
+Picks which algorithm to run on an instance, instead of running all of them like pack_print_all.
+The selector is calibrated from training CSVs written by the selector benchmark in bin_pack_main, which packs
+instances from several weight distributions with every candidate algorithm and writes one row per run with the
+instance's features. Per (Algorithm, Descending?) it fits the gap to the lower bound (SOL/LB - 1) as a linear function
+of the features - the weight histogram, the fractions of items over 1/2 and 1/3, the largest weight and 1/LB - and the
+runtime as a power of n. For a new instance it computes the features in one vectorized pass, predicts each
+algorithm's gap and runtime, and picks the fastest one predicted to be within max_gap of the bound, falling back to the
+most accurate one if none is.
+The pack_and_print result CSVs can't be used for this, since they don't say anything about the instances.
+"""
+import math
+from timeit import default_timer as timer
+
+import numpy as np
+
+from algorithms import ALGORITHMS, get_algorithm
+from bin_pack import Bin
+
+# Number of equal-width bins in the weight histogram feature
+HISTOGRAM_BINS = 10
+
+# The algorithms the selector chooses between. The PTAS depends on eps and the constrained algorithms are First and
+# Best Fit when there are no constraints, so they are left out.
+CANDIDATES = [name for name in ALGORITHMS if name != 'ptas_awfd' and not name.startswith('constrained_')]
+
+FEATURE_NAMES = ['h{}'.format(i) for i in range(HISTOGRAM_BINS)] + \
+                ['Fraction > 1/2', 'Fraction > 1/3', 'Max weight', '1/LB']
+TRAINING_HEADER = 'Row type, Algorithm, Descending?, n, Runtime (s), SOL/LB - 1, ' + ', '.join(FEATURE_NAMES) + '\n'
+
+# Candidates that aren't Next Fit or Any Fit, so the theory cap in Selector.predict doesn't hold for them.
+# bucket_best_fit opens a new bin when try_add_item rejects the bin the buckets found, even if another bin has room.
+UNCAPPED = {'bucket_best_fit'}
+
+# Ridge regularization for the gap fit, which keeps it stable when some features barely vary in the training data
+RIDGE = 1e-3
+# Quantile of the training residuals added to the predicted gap, so that predictions err on the side of too large
+MARGIN_QUANTILE = 0.9
+
+
+def instance_features(items):
+    """
+    :param items: List or array of item weights
+    :return: dict of features of the instance
+    """
+    weights = np.asarray(items, dtype=np.float64) / Bin.CAPACITY
+    n = weights.size
+    total = float(weights.sum())
+    largest = float(weights.max()) if n else 0.0
+    over_half = int(np.count_nonzero(weights > 1 / 2))
+    histogram, edges = np.histogram(weights, bins=HISTOGRAM_BINS, range=(0, 1))
+
+    return {
+        'n': n,
+        'total_weight': total,
+        'max_weight': largest,
+        'fraction_over_half': over_half / n if n else 0.0,
+        'fraction_over_third': float(np.count_nonzero(weights > 1 / 3)) / n if n else 0.0,
+        'histogram': (histogram / n if n else histogram).tolist(),
+        # L1: the bins can't hold less than the total weight
+        'l1_bound': math.ceil(round(total, 9)),
+        # No two items over half can share a bin
+        'lower_bound': max(math.ceil(round(total, 9)), over_half),
+    }
+
+
+def feature_vector(features):
+    """
+    :return: The features the gap is fitted against, in FEATURE_NAMES order
+    """
+    return features['histogram'] + [features['fraction_over_half'], features['fraction_over_third'],
+                                    features['max_weight'], 1 / max(1, features['lower_bound'])]
+
+
+def training_rows(items):
+    """
+    Pack the instance with every candidate algorithm, ascending and descending.
+    :return: List of rows for a training CSV (see TRAINING_HEADER)
+    """
+    features = instance_features(items)
+    vector = ', '.join(str(round(value, 6)) for value in feature_vector(features))
+    lower_bound = max(1, features['lower_bound'])
+
+    rows = []
+    for name in CANDIDATES:
+        algorithm = get_algorithm(name)
+        for descending in [False, True]:
+            t = timer()
+            sol = len(algorithm(list(items), descending))
+            elapsed = timer() - t
+            rows.append('selector, {}, {}, {}, {}, {}, {}\n'.format(
+                name, descending, len(items), round(elapsed, 6), round(sol / lower_bound - 1, 6), vector))
+    return rows
+
+
+def parse_training_row(line):
+    """
+    :return: (algorithm, descending, n, runtime, gap, feature vector) for a training row, or None for any other line
+    """
+    fields = [field.strip() for field in line.split(',')]
+    if len(fields) != 6 + len(FEATURE_NAMES) or fields[0] != 'selector':
+        return None
+    try:
+        return fields[1], fields[2] == 'True', int(fields[3]), float(fields[4]), float(fields[5]), \
+            [float(field) for field in fields[6:]]
+    except ValueError:
+        return None
+
+
+class AlgorithmModel:
+    """
+    Predicted gap and runtime of one (Algorithm, Descending?)
+    """
+
+    def __init__(self, gap_weights, margin, runtime_coefficient, runtime_exponent):
+        # Linear weights of [1] + feature vector
+        self.gap_weights = gap_weights
+        self.margin = margin
+        # runtime = runtime_coefficient * n ** runtime_exponent
+        self.runtime_coefficient = runtime_coefficient
+        self.runtime_exponent = runtime_exponent
+
+    @staticmethod
+    def fit(samples):
+        """
+        :param samples: List of (n, runtime, gap, feature vector)
+        """
+        x = np.array([[1.0] + vector for n, runtime, gap, vector in samples])
+        y = np.array([gap for n, runtime, gap, vector in samples])
+        gap_weights = np.linalg.solve(x.T @ x + RIDGE * np.eye(x.shape[1]), x.T @ y)
+        margin = max(0.0, float(np.quantile(y - x @ gap_weights, MARGIN_QUANTILE)))
+
+        log_n = np.log([max(n, 1) for n, runtime, gap, vector in samples])
+        log_runtime = np.log([max(runtime, 1e-9) for n, runtime, gap, vector in samples])
+        if np.ptp(log_n) > 0:
+            exponent, intercept = np.polyfit(log_n, log_runtime, 1)
+        else:
+            # Every sample has the same n, so assume linear
+            exponent, intercept = 1.0, float(np.mean(log_runtime - log_n))
+        return AlgorithmModel(gap_weights, margin, math.exp(intercept), float(exponent))
+
+    def predict(self, n, vector):
+        """
+        :return: (runtime in s, gap)
+        """
+        gap = float(np.dot(self.gap_weights, [1.0] + vector)) + self.margin
+        return self.runtime_coefficient * max(n, 1) ** self.runtime_exponent, max(0.0, gap)
+
+
+class Selector:
+    def __init__(self, models):
+        """
+        :param models: dict of (algorithm, descending) -> AlgorithmModel, as built by calibrate()
+        """
+        self.models = models
+
+    @staticmethod
+    def calibrate(paths):
+        """
+        Build a Selector from training CSVs written by the selector benchmark
+        """
+        samples = {}
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    row = parse_training_row(line)
+                    if row is None:
+                        continue
+                    algorithm, descending, n, runtime, gap, vector = row
+                    if algorithm in CANDIDATES:
+                        samples.setdefault((algorithm, descending), []).append((n, runtime, gap, vector))
+
+        if not samples:
+            raise Exception('No selector training rows found in ' + ', '.join(paths))
+        return Selector({key: AlgorithmModel.fit(points) for key, points in samples.items()})
+
+    def predict(self, features):
+        """
+        :return: List of (predicted runtime, predicted gap, algorithm, descending), cheapest first
+        """
+        n = features['n']
+        lower_bound = max(1, features['lower_bound'])
+        largest = features['max_weight']
+        vector = feature_vector(features)
+        # Next Fit and every Any Fit algorithm (including the k_bounded ones, which only close a bin that couldn't
+        # take the current item) use at most total / (1 - largest) + 1 bins. That is tight when the items are all
+        # small - closer than a linear fit of the features might predict.
+        if largest < 1:
+            theory_gap = largest / (1 - largest) + 1 / lower_bound
+        else:
+            theory_gap = math.inf
+
+        predictions = []
+        for (algorithm, descending), model in self.models.items():
+            runtime, gap = model.predict(n, vector)
+            if features['fraction_over_half'] == 1:
+                # Every item needs its own bin, so every algorithm is optimal
+                gap = 0.0
+            if algorithm not in UNCAPPED:
+                gap = min(gap, theory_gap)
+            predictions.append((runtime, gap, algorithm, descending))
+        predictions.sort()
+        return predictions
+
+    def select(self, items, max_gap=0.02):
+        """
+        :param max_gap: The largest predicted SOL/LB - 1 to accept from a cheaper algorithm
+        :return: (algorithm name, descending, predicted gap)
+        """
+        predictions = self.predict(instance_features(items))
+        for runtime, gap, algorithm, descending in predictions:
+            if gap <= max_gap:
+                return algorithm, descending, gap
+
+        # Nothing is predicted to be close enough, so use the most accurate, cheapest first on ties
+        runtime, gap, algorithm, descending = min(predictions, key=lambda prediction: (prediction[1], prediction[0]))
+        return algorithm, descending, gap
+
+
+def select_and_pack(items, selector, max_gap=0.02):
+    """
+    Pack the items with the algorithm the selector picks. Like the algorithms themselves, this may sort items.
+    :return: (bins, algorithm name, descending)
+    """
+    algorithm, descending, gap = selector.select(items, max_gap)
+    return get_algorithm(algorithm)(items, descending), algorithm, descending
@@ -0,0 +1,71 @@
+from multiprocessing import Pool
+
+from bin_pack import Bin, best_fit
+
+
+def _pack_shard(task):
+    """
+    Runs in a worker process.
+    :return: A list of bins, each a list of (item index in the whole stream, weight) tuples
+    """
+    algorithm, items, start, step = task
+    # The shard is already sorted if it needs to be, so don't let the algorithm re-sort it, which would lose track of
+    # which item is which.
+    bins = algorithm(items, False)
+    return [[(start + step * name, weight) for name, weight in b.items] for b in bins]
+
+
+def pack_sharded(items, algorithm, decreasing, shards, merge_below=0.9):
+    """
+    Split the items into shards, pack each shard in its own process with the given algorithm, then repack the items of
+    every under-filled bin from all shards together with Best Fit Decreasing.
+    Shard i gets every shards'th item starting at i, so every shard sees the whole weight distribution and, if
+    decreasing, is itself sorted.
+    :param items: List of item weights, each less than Bin.CAPACITY
+    :param algorithm: Any algorithm from bin_pack
+    :param decreasing: Whether or not to sort the items by non-increasing weights before sharding
+    :param shards: Number of worker processes
+    :param merge_below: Bins filled to less than this fraction of Bin.CAPACITY are repacked in the merge stage
+    :return: A list of Bins. Item names are indices into the (sorted, if decreasing) items.
+    """
+    if decreasing:
+        items.sort(reverse=True)
+
+    tasks = [(algorithm, items[shard::shards], shard, shards) for shard in range(shards)]
+    with Pool(shards) as pool:
+        shard_bins = pool.map(_pack_shard, tasks)
+
+    full_bins = []
+    merge_items = []
+    for bins in shard_bins:
+        for b in bins:
+            if sum(weight for name, weight in b) < merge_below * Bin.CAPACITY:
+                merge_items.extend(b)
+            else:
+                full_bins.append(b)
+
+    # best_fit names items by their index in the (sorted) list we give it, so sort here to be able to map them back
+    merge_items.sort(key=lambda item: item[1], reverse=True)
+    merged = best_fit([weight for name, weight in merge_items], False)
+
+    result = []
+    for bin_items in full_bins:
+        b = Bin(len(result))
+        b.items = bin_items
+        b.weight = sum(weight for name, weight in bin_items)
+        result.append(b)
+    for merged_bin in merged:
+        merged_bin.name = len(result)
+        merged_bin.items = [(merge_items[index][0], weight) for index, weight in merged_bin.items]
+        result.append(merged_bin)
+    return result
+
+
+def sharded(algorithm, shards, merge_below=0.9):
+    """
+    Wraps pack_sharded as an algorithm that can be passed to pack_and_print, eg. sharded(best_fit, 4).
+    """
+    def pack(items, decreasing):
+        return pack_sharded(items, algorithm, decreasing, shards, merge_below)
+    pack.__name__ = '{}_x{}'.format(algorithm.__name__, shards)
+    return pack
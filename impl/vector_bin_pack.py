@@ -0,0 +1,324 @@
+import heapq
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+class VectorBins:
+    """
+    The open bins of a d-dimensional vector bin packing, eg. a (CPU, memory) pair per bin.
+    Residual capacities are stored as one NumPy matrix with a row per bin, so checking a group of bins against an item
+    is a single vectorized comparison instead of a Python loop over Bin objects.
+
+    To avoid checking every bin for every item, the bins are also grouped into a grid of about GRID_CELLS cells by
+    their residual capacity, G cells per dimension, so bins with similar room in every dimension share a cell. For an
+    item, the cells are split three ways by comparing their coordinates to the item's:
+    - Cells below it in some dimension hold no bin that fits, and are skipped without looking at their bins.
+    - Cells above it in every dimension hold only bins that fit. First Fit takes the lowest bin index among them from
+      a per-cell array of minimum indices, without looking at their bins.
+    - Only the cells in the item's own row in some dimension have to have their bins checked one by one.
+    Best and Worst Fit branch and bound over the cells instead, using each cell's corners to bound the dot product
+    score of the bins in it, and stop once no remaining cell can beat the best bin found.
+
+    The cost of placing an item is O(cells) vectorized, plus the bins in the cells that have to be checked. Those are
+    usually a small fraction of the open bins, so this keeps placement fast with 10^5 open bins, but it is not a
+    worst-case guarantee: if most bins fall into the cells on the item's boundary, they are all checked.
+    """
+    GRID_CELLS = 4096
+
+    def __init__(self, dimensions, capacity=None, initial_size=1024):
+        if capacity is None:
+            capacity = np.ones(dimensions)
+        self.capacity = np.asarray(capacity, dtype=np.float64)
+        if self.capacity.shape != (dimensions,):
+            raise Exception('Capacity must have one entry per dimension')
+
+        self.dimensions = dimensions
+        self.count = 0
+        self.residuals = np.empty((initial_size, dimensions))
+        # items[b] is the list of item indices packed into bin b
+        self.items = []
+
+        # Cells per dimension
+        self.grid = max(2, int(self.GRID_CELLS ** (1 / dimensions) + 1e-9))
+        shape = (self.grid,) * dimensions
+        self.cell_ids = np.arange(self.grid ** dimensions).reshape(shape)
+        corners = np.stack(np.unravel_index(np.arange(self.grid ** dimensions), shape), axis=1)
+        # Corners of each cell in residual units, widened a little so that rounding can't put a bin outside them
+        self.cell_low = (corners / self.grid - 1e-9) * self.capacity
+        self.cell_high = ((corners + 1) / self.grid + 1e-9) * self.capacity
+        # The bins in each cell, and the lowest bin index in each (inf if empty). Heaps of the bin indices that were
+        # in each cell find the lowest one, skipping bins that have since moved out.
+        self.cell_bins = [set() for x in range(self.grid ** dimensions)]
+        self.cell_heaps = [[] for x in range(self.grid ** dimensions)]
+        self.cell_min = np.full(self.grid ** dimensions, np.inf)
+        self.bin_cells = []
+
+    def __len__(self):
+        return self.count
+
+    def _coordinates(self, vector):
+        return np.minimum((vector / self.capacity * self.grid).astype(np.int64), self.grid - 1)
+
+    def _refresh_min(self, cell):
+        heap = self.cell_heaps[cell]
+        while heap and self.bin_cells[heap[0]] != cell:
+            heapq.heappop(heap)
+        self.cell_min[cell] = heap[0] if heap else np.inf
+
+    def _update(self, bin_index):
+        """
+        Move the bin into the cell of its residual capacity, if it changed. Residuals only shrink, so a bin never
+        returns to a cell it left.
+        """
+        cell = int(np.ravel_multi_index(self._coordinates(self.residuals[bin_index]), self.cell_ids.shape))
+        previous = self.bin_cells[bin_index]
+        if cell == previous:
+            return
+        self.bin_cells[bin_index] = cell
+        if previous is not None:
+            self.cell_bins[previous].discard(bin_index)
+            self._refresh_min(previous)
+        self.cell_bins[cell].add(bin_index)
+        heapq.heappush(self.cell_heaps[cell], bin_index)
+        self._refresh_min(cell)
+
+    def _cell_fits(self, cell, item):
+        """
+        :return: Array of the indices of the bins in the cell that fit the item
+        """
+        bins = np.fromiter(self.cell_bins[cell], dtype=np.int64, count=len(self.cell_bins[cell]))
+        return bins[np.all(self.residuals[bins] >= item, axis=1)]
+
+    def loads(self):
+        """
+        Returns the load matrix (one row per open bin).
+        """
+        return self.capacity - self.residuals[:self.count]
+
+    def open_bin(self):
+        if self.count == self.residuals.shape[0]:
+            residuals = np.empty((2 * self.count, self.dimensions))
+            residuals[:self.count] = self.residuals
+            self.residuals = residuals
+        index = self.count
+        self.count += 1
+        self.residuals[index] = self.capacity
+        self.items.append([])
+        self.bin_cells.append(None)
+        self._update(index)
+        return index
+
+    def add_item(self, bin_index, item_index, item):
+        if not np.all(self.residuals[bin_index] >= item):
+            raise Exception('Error! Bin {} does not have room for item {}'.format(bin_index, item_index))
+        self.residuals[bin_index] -= item
+        self.items[bin_index].append(item_index)
+        self._update(bin_index)
+
+    def candidates(self, item):
+        """
+        Returns the indices of all open bins that can fit the given item vector, in increasing bin order.
+        This checks every open bin, so use first_fit(), best_fit() or worst_fit() to place items.
+        :param item: A vector with one demand per dimension
+        """
+        return np.flatnonzero(np.all(self.residuals[:self.count] >= item, axis=1))
+
+    def first_fit(self, item):
+        """
+        Returns the lowest-indexed open bin that can fit the given item vector, or None if there is none.
+        """
+        low = self._coordinates(item)
+        cell_min = self.cell_min.reshape(self.cell_ids.shape)
+
+        # Every bin in a cell above the item's in all dimensions fits
+        target = np.inf
+        if np.all(low + 1 < self.grid):
+            target = cell_min[tuple(slice(c + 1, None) for c in low)].min()
+
+        # The cells in the item's row in some dimension might have bins that fit, check the ones with lower indices
+        box = tuple(slice(c, None) for c in low)
+        boundary = np.zeros(cell_min[box].shape, dtype=bool)
+        for dimension in range(self.dimensions):
+            boundary[(slice(None),) * dimension + (0,)] = True
+        cells = self.cell_ids[box][boundary & (cell_min[box] < target)]
+        for cell in cells[np.argsort(self.cell_min[cells], kind='stable')]:
+            if self.cell_min[cell] >= target:
+                break
+            fits = self._cell_fits(cell, item)
+            if fits.size > 0:
+                target = min(target, fits.min())
+
+        if target == np.inf:
+            return None
+        return int(target)
+
+    def best_fit(self, item):
+        """
+        Returns the open bin that can fit the item whose capacity-normalized load has the largest dot product with the
+        item's (the lowest-indexed one on ties), or None if no bin fits.
+        """
+        return self._dot_product_search(item, True)
+
+    def worst_fit(self, item):
+        """
+        Like best_fit(), but the bin with the smallest dot product.
+        """
+        return self._dot_product_search(item, False)
+
+    def _dot_product_search(self, item, best):
+        # Normalize by capacity so that no one dimension dominates the score. The score of a bin is then
+        # (capacity - residual) / capacity @ (item / capacity) = base - residual @ weights, so a cell's low corner
+        # bounds the scores of its bins from above and its high corner from below.
+        weights = item / self.capacity / self.capacity
+        base = float(np.sum(item / self.capacity))
+        # Negate for Best Fit, so that the search always minimizes
+        sign = -1 if best else 1
+
+        cells = self.cell_ids[tuple(slice(c, None) for c in self._coordinates(item))].ravel()
+        cells = cells[self.cell_min[cells] < np.inf]
+        bounds = sign * (base - (self.cell_low[cells] if best else self.cell_high[cells]) @ weights)
+        order = np.argsort(bounds, kind='stable')
+
+        target = None
+        target_score = np.inf
+        for cell, bound in zip(cells[order], bounds[order]):
+            if bound > target_score:
+                break
+            fits = self._cell_fits(cell, item)
+            if fits.size == 0:
+                continue
+            scores = sign * (base - self.residuals[fits] @ weights)
+            lowest = scores.min()
+            index = int(fits[scores == lowest].min())
+            if lowest < target_score or (lowest == target_score and index < target):
+                target = index
+                target_score = lowest
+        return target
+
+    def assignment(self, item_count):
+        """
+        Returns an array mapping each item index to the bin it was packed into.
+        """
+        result = np.full(item_count, -1, dtype=np.int64)
+        for bin_index, bin_items in enumerate(self.items):
+            result[bin_items] = bin_index
+        return result
+
+    def __str__(self):
+        result = ''
+        for bin_index in range(self.count):
+            result += 'Bin {}: Items {} Load {}\n'.format(bin_index, self.items[bin_index],
+                                                          np.round(self.capacity - self.residuals[bin_index], 6))
+        return result.strip()
+
+
+def _prepare(items, decreasing, capacity):
+    """
+    Converts items to an (n, d) matrix and returns it along with the order to pack them in.
+    Items are sorted by the L2 norm of their capacity-normalized demand vectors when decreasing is set.
+    """
+    items = np.asarray(items, dtype=np.float64)
+    if items.ndim != 2:
+        raise Exception('Items must be a 2D array of shape (n, d)')
+    if capacity is None:
+        capacity = np.ones(items.shape[1])
+    capacity = np.asarray(capacity, dtype=np.float64)
+    if np.any(items > capacity):
+        raise Exception('Error! An item is larger than the bin in at least one dimension.')
+
+    if decreasing:
+        order = np.argsort(-np.linalg.norm(items / capacity, axis=1), kind='stable')
+    else:
+        order = np.arange(items.shape[0])
+    return items, order, capacity
+
+
+def vector_first_fit(items, decreasing, capacity=None):
+    """
+    First Fit for vector items. With decreasing=True this is FFD-by-norm.
+    :param items: (n, d) array of item demand vectors, each no larger than capacity in any dimension
+    :param decreasing: Whether or not to sort the items by non-increasing L2 norm before packing
+    :param capacity: Per-dimension bin capacity, defaults to 1 in each dimension
+    :return: The VectorBins the items were packed into
+    """
+    items, order, capacity = _prepare(items, decreasing, capacity)
+    bins = VectorBins(items.shape[1], capacity)
+
+    for index in order:
+        item = items[index]
+        target = bins.first_fit(item)
+        if target is None:
+            target = bins.open_bin()
+        bins.add_item(target, index, item)
+
+    return bins
+
+
+def vector_best_fit(items, decreasing, capacity=None):
+    """
+    Dot-product Best Fit: among the bins that fit the item, pick the one whose load vector has the largest dot product
+    with the item, ie. the bin the item is most aligned with.
+    Parameters are the same as vector_first_fit.
+    """
+    return _dot_product_fit(items, decreasing, capacity, True)
+
+
+def vector_worst_fit(items, decreasing, capacity=None):
+    """
+    Dot-product Worst Fit: among the bins that fit the item, pick the one whose load vector has the smallest dot
+    product with the item.
+    Parameters are the same as vector_first_fit.
+    """
+    return _dot_product_fit(items, decreasing, capacity, False)
+
+
+def _dot_product_fit(items, decreasing, capacity, best):
+    items, order, capacity = _prepare(items, decreasing, capacity)
+    bins = VectorBins(items.shape[1], capacity)
+
+    for index in order:
+        item = items[index]
+        if best:
+            target = bins.best_fit(item)
+        else:
+            target = bins.worst_fit(item)
+        if target is None:
+            target = bins.open_bin()
+        bins.add_item(target, index, item)
+
+    return bins
+
+
+def pack_and_print_vector(items, algorithm, outfile, descending, capacity=None):
+    items = np.asarray(items, dtype=np.float64)
+    if capacity is None:
+        capacity = np.ones(items.shape[1])
+    # Each dimension gives its own lower bound, and the instance needs at least the largest of them
+    opt = int(np.max(np.ceil(items.sum(axis=0) / capacity)))
+    print('Lower bound for {} items with {} dimensions is {} bins'.format(items.shape[0], items.shape[1], opt))
+
+    name = algorithm.__name__
+    print('Packing {} items using {}, descending={}'.format(items.shape[0], name, descending))
+
+    t = timer()
+    bins = algorithm(items, descending, capacity)
+    elapsed = round(timer() - t, 6)
+
+    print('Took ' + str(elapsed) + "s")
+    sol = len(bins)
+    print('Used {} bins compared to a lower bound of {}'.format(sol, opt))
+    ratio = round(sol / opt, 6)
+    print('{} approx ratio for this instance is {}'.format(name, ratio))
+
+    with open(outfile, 'a') as f:
+        f.write("{}, {}, {}, {}, {}, {}, {}\n"
+                .format(name, descending, items.shape[0], elapsed, sol, opt, ratio))
+
+
+def pack_print_all_vector(items, outfile):
+    pack_and_print_vector(items, vector_first_fit, outfile, True)
+    pack_and_print_vector(items, vector_best_fit, outfile, True)
+    pack_and_print_vector(items, vector_worst_fit, outfile, True)
+    pack_and_print_vector(items, vector_best_fit, outfile, False)
+    pack_and_print_vector(items, vector_worst_fit, outfile, False)